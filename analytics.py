@@ -0,0 +1,98 @@
+from datetime import datetime
+import pandas as pd
+
+# --- محرك التحليلات (Aggregation على السيرفر) ---
+# بدل ما نسحب كل التذاكر في DataFrame، الـ Mongo بيعمل الفلترة والعد على ticket_rollups
+# واحنا بنستلم بس النتايج الصغيرة اللي بتترسم
+
+ALL_DAYS = "الكل (الشهر بالكامل)"
+TOP_N = 15
+
+
+# site_id = None معناها كل الفروع (سكريبتات الصيانة)، والتطبيق دايماً بيبعت فرع المستخدم
+def _site(site_id):
+    return {} if site_id is None else {"site_id": site_id}
+
+
+def list_months(db, site_id=None):
+    months = db.ticket_rollups.distinct("month_year", _site(site_id))
+    return sorted([m for m in months if isinstance(m, str)], reverse=True)
+
+
+def list_days(db, month, site_id=None):
+    days = db.ticket_rollups.distinct("date_only", {**_site(site_id), "month_year": month})
+    return sorted([d for d in days if isinstance(d, str)])
+
+
+def watermark(db, month, day=ALL_DAYS, site_id=None):
+    # آخر تعديل على إحصائيات الفترة - لو اتغيرت يبقى النتايج المتخزنة قديمة
+    # يوم معين بيتعلم بـ date_only بس، فطلب جديد النهارده مايبوظش كاش باقي أيام الشهر
+    # (indexes على site_id + month_year / date_only + updated_at)
+    latest = db.ticket_rollups.find_one(period_match(month, day, site_id), {"updated_at": 1}, sort=[("updated_at", -1)])
+    return (latest or {}).get("updated_at")
+
+
+def period_match(month, day=ALL_DAYS, site_id=None):
+    if day and day != ALL_DAYS:
+        return {**_site(site_id), "date_only": day}
+    return {**_site(site_id), "month_year": month}
+
+
+def period_range(month, day=ALL_DAYS, site_id=None):
+    # نفس الفترة بس على created_at (للاستعلامات على التذاكر نفسها عشان تستخدم الـ index)
+    if day and day != ALL_DAYS:
+        start = datetime.strptime(day, "%Y-%m-%d")
+        end = datetime.fromordinal(start.toordinal() + 1)
+    else:
+        start = datetime.strptime(month, "%Y-%m")
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return {**_site(site_id), "created_at": {"$gte": start, "$lt": end}}
+
+
+def _top(field, limit=None):
+    stages = [
+        {"$group": {"_id": field, "count": {"$sum": "$count"}}},
+        {"$sort": {"count": -1, "_id": 1}},
+    ]
+    if limit:
+        stages.append({"$limit": limit})
+    return stages
+
+
+def type_report(db, match, ticket_type, top_n=TOP_N):
+    # Round-trip واحد بيرجع كل أرقام التبويب (KPIs + Top-N)
+    pipeline = [
+        {"$match": {**match, "type": ticket_type}},
+        {"$project": {"_id": 0, "item": "$item_clean", "user_room": 1, "user_name": 1, "count": 1}},
+        {"$facet": {
+            "total": [{"$group": {"_id": None, "n": {"$sum": "$count"}}}],
+            "items": _top("$item", top_n),
+            "rooms": _top("$user_room", top_n),
+            "users": _top("$user_name", top_n),
+            "user_items": _top({"user_name": "$user_name", "item": "$item"}),
+        }},
+    ]
+    result = next(db.ticket_rollups.aggregate(pipeline), {})
+    total = result.get("total") or [{"n": 0}]
+    users = [r["_id"] for r in result.get("users", [])]
+    # تفاصيل (موظف × صنف) للأكثر طلباً بس عشان الرسمة تفضل مقروءة
+    user_items = [
+        {"user_name": r["_id"].get("user_name"), "item": r["_id"].get("item"), "count": r["count"]}
+        for r in result.get("user_items", [])
+        if r["_id"].get("user_name") in users
+    ]
+    return {
+        "total": total[0]["n"],
+        "items": _frame(result.get("items", [])),
+        "rooms": _frame(result.get("rooms", [])),
+        "users": _frame(result.get("users", [])),
+        "user_items": pd.DataFrame(user_items, columns=["user_name", "item", "count"]),
+    }
+
+
+def _frame(rows):
+    return pd.DataFrame([(r["_id"], r["count"]) for r in rows], columns=["name", "count"])
+
+
+def top_name(frame):
+    return frame["name"].iloc[0] if not frame.empty else "-"
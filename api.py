@@ -0,0 +1,280 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import re
+import time
+import tomllib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pymongo
+from bson.errors import InvalidId
+import data
+from live_queue import TicketFeed, OPEN_STATUSES
+from telemetry import telemetry
+
+# --- API خفيف (HTTP + JSON) للطلبات وطابور مقدمي الخدمة ---
+# بدل سيشن Streamlit كاملة عشان insert_one واحد: الكشك أو الموبايل أو أي سكريبت يطلب من هنا
+# نفس دوال الداتا والكاش اللي بيستخدمها app.py، والتوكن موقع بـ HMAC فمفيش قراية من الداتا بيز عشان نتأكد منه
+#
+#   POST /api/login                 {"username", "password"} => {"token"}
+#   GET  /api/menu                  المشروبات المتاحة
+#   POST /api/orders                {"type": "Office", "drink", "sugar", "notes"} أو {"type": "IT", "issue", "details"}
+#                                   + "client_key" اختياري: إعادة نفس الطلب بنفس المفتاح بترجع نفس التذكرة
+#   GET  /api/queue?since=&timeout= طابور مقدم الخدمة (long-polling لحد ما يتغير)
+#   POST /api/tickets/<id>/done     قفل الطلب
+#   GET  /metrics                   أرقام التشخيص بصيغة Prometheus
+
+TOKEN_TTL = 12 * 3600   # ثانية
+LONG_POLL_MAX = 25      # ثانية
+POLL_INTERVAL = 1       # ثانية (لو الـ Change Streams مش متاحة)
+MAX_BODY = 64 * 1024
+MAX_CLIENT_KEY = 128
+PROVIDER_TYPES = {"Office Boy": "Office", "IT Support": "IT"}
+
+log = logging.getLogger(__name__)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _text(body, field, default=""):
+    # أي قيمة من العميل بتتكتب في الداتا بيز أو تدخل في query لازم تكون نص (مش list أو {"$ne": ...})
+    value = body.get(field, default)
+    if value is None:
+        value = default
+    if not isinstance(value, str):
+        raise ApiError(400, f"{field} لازم يكون نص")
+    return value
+
+
+def get_settings():
+    # [api] في .streamlit/secrets.toml، والـ secret ممكن ييجي من ITQAN_API_SECRET
+    settings = {}
+    path = os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            settings = tomllib.load(f).get("api", {})
+    settings["secret"] = os.environ.get("ITQAN_API_SECRET", settings.get("secret"))
+    if not settings["secret"]:
+        raise SystemExit("api secret مش متحدد: [api] secret في secrets.toml أو ITQAN_API_SECRET")
+    return settings
+
+
+# --- التوكن: username:site_id:expires:signature ---
+def _sign(secret, payload):
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(secret, username, site_id, ttl=TOKEN_TTL):
+    payload = f"{username}:{site_id}:{int(time.time()) + ttl}"
+    return base64.urlsafe_b64encode(f"{payload}:{_sign(secret, payload)}".encode()).decode()
+
+
+def read_token(secret, token):
+    # => (username, site_id) أو None
+    try:
+        username, site_id, expires, signature = base64.urlsafe_b64decode(token.encode()).decode().rsplit(":", 3)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(secret, f"{username}:{site_id}:{expires}")) or int(expires) < time.time():
+        return None
+    return username, site_id
+
+
+def _ticket(t):
+    return {
+        "id": str(t['_id']),
+        "user_name": t.get('user_name'),
+        "user_room": t.get('user_room'),
+        "item": t.get('item'),
+        "details": t.get('details'),
+        "status": t.get('status'),
+        "timestamp": t.get('timestamp'),
+    }
+
+
+class Api:
+    def __init__(self, db, secret, feed=None):
+        self.db = db
+        self.secret = secret
+        self.feed = feed
+
+    # --- الصلاحيات ---
+    def authenticate(self, header):
+        token = (header or "").removeprefix("Bearer ").strip()
+        identity = read_token(self.secret, token) if token else None
+        # المستخدمين من الكاش المشترك لفرعه (من غير الباسورد) - لو اتمسح أو اتنقل فرع التوكن بيقف
+        user = None
+        if identity:
+            username, site_id = identity
+            user = next((u for u in data.get_users(self.db, site_id) if u.get('username') == username), None)
+        if user is None:
+            raise ApiError(401, "توكن غلط أو منتهي")
+        return user
+
+    def provider_type(self, user):
+        ticket_type = PROVIDER_TYPES.get(user['role'])
+        if ticket_type is None:
+            raise ApiError(403, "الطابور لمقدمي الخدمة بس")
+        return ticket_type
+
+    # --- الـ endpoints ---
+    def login(self, body):
+        user = data.get_user(self.db, _text(body, "username"), _text(body, "password"))
+        if not user:
+            raise ApiError(401, "بيانات الدخول غلط")
+        return {"token": make_token(self.secret, user['username'], data.site_of(user)), "name": user['name'], "role": user['role']}
+
+    def menu(self, user):
+        return {"drinks": [d['name'] for d in data.get_menu(self.db, available_only=True, site_id=data.site_of(user))]}
+
+    def place_order(self, user, body):
+        # الكتابة هنا مش على دفعات: الـ id اللي راجع لازم يكون اتكتب فعلاً عشان العميل يقدر يعيد بنفس المفتاح
+        client_key = body.get("client_key")
+        if client_key is not None and not (isinstance(client_key, str) and 0 < len(client_key) <= MAX_CLIENT_KEY):
+            raise ApiError(400, "client_key لازم يكون نص لحد 128 حرف")
+        if body.get("type") == "Office":
+            drink, sugar, notes = _text(body, "drink"), _text(body, "sugar") or "مظبوط", _text(body, "notes")
+            if drink not in {d['name'] for d in data.get_menu(self.db, available_only=True, site_id=data.site_of(user))}:
+                raise ApiError(400, "المشروب مش متاح")
+            ticket_id = data.add_ticket(self.db, user, "Office", f"{drink} - {sugar}", notes, drink=drink, sugar=sugar, client_key=client_key)
+        elif body.get("type") == "IT":
+            issue, details = _text(body, "issue"), _text(body, "details")
+            if not issue:
+                raise ApiError(400, "issue مطلوبة")
+            ticket_id = data.add_ticket(self.db, user, "IT", issue, details, issue=issue, client_key=client_key)
+        else:
+            raise ApiError(400, "type لازم يكون Office أو IT")
+        return {"id": str(ticket_id)}
+
+    def queue(self, user, since=None, timeout=LONG_POLL_MAX):
+        # بيرجع على طول لو since مش زي النسخة الحالية، وإلا بيستنى لحد ما الطابور يتغير أو الوقت يخلص
+        ticket_type = self.provider_type(user)
+        site_id = data.site_of(user)
+        # nan / inf مابيتقصوش بـ min/max => long-poll مابيرجعش أبداً وبيمسك thread من السيرفر
+        if not math.isfinite(timeout):
+            raise ApiError(400, "timeout لازم يكون رقم")
+        timeout = min(max(timeout, 0), LONG_POLL_MAX)
+        if self.feed and self.feed.available:
+            if since is not None and str(self.feed.version(site_id, ticket_type)) == since:
+                self.feed.wait_for_change(site_id, ticket_type, int(since), timeout=timeout)
+            if self.feed.available:
+                tickets = [t for t in self.feed.snapshot(site_id, ticket_type) if t['status'] == "New"]
+                return {"version": str(self.feed.version(site_id, ticket_type)), "tickets": [_ticket(t) for t in tickets]}
+        # polling: النسخة بصمة للطابور نفسه
+        deadline = time.monotonic() + timeout
+        while True:
+            tickets = list(self.db.tickets.find({"site_id": site_id, "type": ticket_type, "status": "New"}).sort("created_at"))
+            version = hashlib.sha1("".join(str(t['_id']) for t in tickets).encode()).hexdigest()[:16]
+            if since != version or time.monotonic() >= deadline:
+                return {"version": version, "tickets": [_ticket(t) for t in tickets]}
+            time.sleep(POLL_INTERVAL)
+
+    def done(self, user, ticket_id):
+        try:
+            changed = data.update_ticket_status(self.db, ticket_id, "Done", ticket_type=self.provider_type(user), provider=user['username'], site_id=data.site_of(user))
+        except InvalidId:
+            raise ApiError(404, "رقم الطلب غلط")
+        return {"done": changed}
+
+
+class Handler(BaseHTTPRequestHandler):
+    api = None  # بيتحدد في serve()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        telemetry.begin_rerun()
+        try:
+            if (method, url.path) == ("GET", "/metrics"):
+                return self._send(200, telemetry.prometheus(), "text/plain; version=0.0.4")
+            if (method, url.path) == ("POST", "/api/login"):
+                with telemetry.section("api_login"):
+                    return self._send(200, self.api.login(self._body()))
+            with telemetry.section("api_auth"):
+                user = self.api.authenticate(self.headers.get("Authorization"))
+            telemetry.set_role(user['role'])
+            done = re.fullmatch(r"/api/tickets/([0-9a-f]{24})/done", url.path)
+            if (method, url.path) == ("GET", "/api/menu"):
+                with telemetry.section("api_menu"):
+                    return self._send(200, self.api.menu(user))
+            if (method, url.path) == ("POST", "/api/orders"):
+                with telemetry.section("api_order"):
+                    return self._send(201, self.api.place_order(user, self._body()))
+            if (method, url.path) == ("GET", "/api/queue"):
+                with telemetry.section("api_queue"):
+                    return self._send(200, self.api.queue(user, query.get("since"), float(query.get("timeout", LONG_POLL_MAX))))
+            if method == "POST" and done:
+                with telemetry.section("api_done"):
+                    return self._send(200, self.api.done(user, done.group(1)))
+            raise ApiError(404, "مش موجود")
+        except ApiError as e:
+            self._send(e.status, {"error": str(e)})
+        except ValueError:
+            self._send(400, {"error": "طلب غلط"})
+        except Exception:
+            # أي غلط تاني (زي PyMongoError) بيرجع 500 بدل ما الاتصال يتقفل من غير رد
+            log.exception("%s %s failed", method, url.path)
+            self._send(500, {"error": "خطأ في السيرفر"})
+        finally:
+            telemetry.end_rerun()
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, "الطلب كبير")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError(body)
+        return body
+
+    def _send(self, status, payload, content_type="application/json; charset=utf-8"):
+        raw = payload.encode() if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(db, secret, host="0.0.0.0", port=8502, feed=None):
+    # ThreadingHTTPServer: كل طلب (وكل long-poll) في thread لوحده
+    handler = type("ApiHandler", (Handler,), {"api": Api(db, secret, feed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="API للطلبات وطابور مقدمي الخدمة")
+    parser.add_argument("--host", default=settings.get("host", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=settings.get("port", 8502))
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(data.get_connection_string(), event_listeners=[telemetry])[data.APP_DB]
+    feed = TicketFeed(db.tickets, OPEN_STATUSES)
+    feed.start()
+    server = serve(db, settings["secret"], args.host, args.port, feed)
+    print(f"API على http://{args.host}:{args.port} ({'change streams' if feed.available else 'polling'})")
+    try:
+        server.serve_forever()
+    finally:
+        feed.stop()
@@ -1,45 +1,83 @@
 import streamlit as st
-import pandas as pd
 import pymongo
 import plotly.express as px
-from datetime import datetime
 import time
+import uuid
+import atexit
+from pymongo import WriteConcern
 import streamlit.components.v1 as components
-from bson.objectid import ObjectId
 import base64
+import io
+from live_queue import TicketFeed, OPEN_STATUSES
+from order_buffer import OrderBuffer
+import analytics
+import rollups
+import schema
+import export
+import dispatch
+import archive
+import bulk_io
+import service_stats
+from telemetry import telemetry
+from resultcache import results, RESULT_CACHE_MB
+from data import get_user, add_ticket, update_ticket_status, toggle_stock, seed_menu, seed_rooms
+from data import get_menu, get_rooms, add_menu_item, reset_menu, add_room, delete_room, add_user, delete_user
+from data import PAGE_SIZE, search_users, count_open_tickets, open_tickets, DEFAULT_SITE, site_of, APP_DB
 
 # --- إعداد الصفحة ---
 st.set_page_config(page_title="نظام إتقان", layout="wide", page_icon="☕")
 
+# --- قياس الأداء (كل rerun + أوامر الـ Mongo) ---
+telemetry.begin_rerun()
+telemetry.prometheus_file = st.secrets.get("telemetry", {}).get("prometheus_file")
+
 # --- الاتصال بقاعدة البيانات (Fast & Cached) ---
 # إلغاء TTL عشان الاتصال يفضل مفتوح ومايخدش وقت في إعادة الاتصال
 @st.cache_resource(ttl=None)
 def init_connection():
-    return pymongo.MongoClient(st.secrets["mongo"]["connection_string"])
+    return pymongo.MongoClient(st.secrets["mongo"]["connection_string"], event_listeners=[telemetry])
 
 client = init_connection()
-db = client.itqan_db
-
-# --- (1) تهيئة المنيو (Upsert لمنع التكرار) ---
-def init_menu():
-    default_drinks = ["قهوة", "شاي", "نسكافيه", "مياه", "ينسون", "نعناع", "كركديه"]
-    for d in default_drinks:
-        db.menu.update_one(
-            {"name": d}, 
-            {"$setOnInsert": {"name": d, "available": True}}, 
-            upsert=True
-        )
-
-# --- (2) تهيئة الغرف (Teams/Rooms) ---
-def init_rooms():
-    if db.rooms.count_documents({}) == 0:
-        default_rooms = ["IT Office", "HR Room", "Accounts", "CEO Office", "Reception", "Sales Team"]
-        for r in default_rooms:
-            db.rooms.insert_one({"name": r})
-
-# تشغيل التهيئة مرة واحدة عند البدء
-init_menu()
-init_rooms()
+db = client[APP_DB]
+
+# --- الطابور المباشر (مستمع واحد للبروسيس كله بدل ما كل شاشة تسأل الداتا بيز كل ثانية) ---
+@st.cache_resource(ttl=None)
+def init_ticket_feed():
+    feed = TicketFeed(db.tickets)
+    feed.start()
+    return feed
+
+# --- تجهيز الداتا بيز مرة واحدة للبروسيس (Indexes + Migrations + Rollups) ---
+@st.cache_resource(ttl=None)
+def init_database():
+    return schema.bootstrap(db)
+
+schema_warnings = init_database()
+
+# --- كتابة الطلبات على دفعات (Group Commit) ---
+# الزرار بيرجع على طول والطلبات اللي جت في نفس اللحظة بتتكتب مع بعض في insert_many واحد
+# order_write_concern: 1 (الـ primary بس) أو "majority" (أبطأ بس مابيضيعش لو الـ primary وقع)
+@st.cache_resource(ttl=None)
+def init_order_buffer():
+    settings = st.secrets.get("app", {})
+    if not settings.get("order_buffer", True):
+        return None
+    buffer = OrderBuffer(db, write_concern=WriteConcern(w=settings.get("order_write_concern", 1)),
+                         flush_interval=settings.get("order_flush_ms", 50) / 1000)
+    # الطلبات اللي لسه في الطابور بتتكتب قبل ما البروسيس يقفل
+    atexit.register(buffer.stop)
+    return buffer.start()
+
+order_buffer = init_order_buffer()
+
+# --- تهيئة المنيو والغرف (مرة واحدة للبروسيس لكل فرع مش مع كل rerun) ---
+@st.cache_resource(ttl=None)
+def init_defaults(site_id=DEFAULT_SITE):
+    seed_menu(db, site_id)
+    seed_rooms(db, site_id)
+    return True
+
+init_defaults()
 
 # --- تشغيل الصوت (Base64 - بدون تحميل من النت) ---
 def play_sound():
@@ -74,30 +112,220 @@ def play_sound():
     """
     components.html(sound_code, height=0, width=0)
 
-# --- دوال التعامل مع الداتا ---
-def get_user(username, password):
-    return db.users.find_one({"username": username, "password": password})
-
-def add_ticket(user_data, type, item, details):
-    now = datetime.now()
-    ticket = {
-        "user_name": user_data['name'],
-        "user_room": user_data['room'],
-        "type": type,
-        "item": item,
-        "details": details,
-        "status": "New",
-        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"), # التاريخ والوقت
-        "date_only": now.strftime("%Y-%m-%d"),          # التاريخ بس (للفلترة اليومية)
-        "month_year": now.strftime("%Y-%m")             # الشهر والسنة (للفلترة الشهرية)
+# --- اللوحات المباشرة (Fragments) ---
+# طابور مقدمي الخدمة والمراقبة الحية بيتحدثوا لوحدهم من غير rerun للسكريبت كله
+LIVE_REFRESH_SECONDS = st.secrets.get("app", {}).get("live_refresh_seconds", 1)
+# وضع التوزيع: كل مقدم خدمة بيستلم الطلب الأول بدل ما الكل يشوف نفس القائمة
+DISPATCH_MODE = st.secrets.get("app", {}).get("dispatch", False)
+# أقصى حجم لكاش التحليلات (ميجا)
+results.max_bytes = st.secrets.get("app", {}).get("analytics_cache_mb", RESULT_CACHE_MB) * 1024 * 1024
+
+# --- مفتاح الطلب (Idempotency) لكل فورم ---
+# لو نفس الطلب اتداس مرتين ورا بعض (أو الـ rerun اتعاد) بيتبعت بنفس المفتاح والداتا بيز بترفض التاني
+# ولو الطلب اتغير أو عدى DOUBLE_SUBMIT_SECONDS من آخر ضغطة بيتعمل مفتاح جديد (طلب جديد بجد)
+DOUBLE_SUBMIT_SECONDS = 5
+
+def order_key(form, *content):
+    key, sent_at, last = st.session_state.get(f"order_key_{form}", (None, 0, None))
+    if key is None or last != content or time.time() - sent_at > DOUBLE_SUBMIT_SECONDS:
+        key = uuid.uuid4().hex
+    st.session_state[f"order_key_{form}"] = (key, time.time(), content)
+    return key
+
+# --- ملف التقرير (بيتنادى من زرار التحميل بس لما حد يدوس عليه) ---
+# الـ cursor بيتقرا على دفعات بس الملف كله بيتبني في الذاكرة (Streamlit بيخزن البايتس في الذاكرة كده كده)
+# للفترات الكبيرة: python export.py بيكتب على الديسك مباشرة
+def report_bytes(period, export_format):
+    out = io.BytesIO()
+    export.WRITERS[export_format](db, period, out)
+    return out.getvalue()
+
+def live_tickets(ticket_type):
+    # الطلبات المفتوحة (New + InProgress) في فرع المستخدم
+    # لو الـ Change Streams شغالة بناخد الطابور من الذاكرة بدل query كل تحديث (من غير أي قراية من الـ Mongo)
+    # الـ fragment مابيستناش تغيير في الطابور: ضغطة زرار جوه fragment مابتقطعش الـ run الشغال، فأي انتظار بيأخرها
+    feed = init_ticket_feed()
+    if feed.available:
+        return feed.snapshot(site, ticket_type)
+    query = {"site_id": site, "status": {"$in": list(OPEN_STATUSES)}}
+    if ticket_type is not None:
+        query["type"] = ticket_type
+    return list(db.tickets.find(query).sort("created_at"))
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_monitor():
+    with telemetry.rerun(), telemetry.section("monitor", user['role']):
+        # صفحة واحدة في جدول واحد بدل عنصر لكل طلب
+        feed = init_ticket_feed()
+        if feed.available:
+            tickets = live_tickets(None)
+            total = len(tickets)
+        else:
+            total = count_open_tickets(db, site)
+        if not total:
+            st.success("الجو رايق.. مفيش طلبات معلقة.")
+            return
+
+        pages = -(-total // PAGE_SIZE)
+        st.session_state['monitor_page'] = min(st.session_state.get('monitor_page', 1), pages)
+        page = st.number_input(f"الصفحة (من {pages}) - {total} طلب مفتوح", min_value=1, max_value=pages, key="monitor_page")
+        skip = (page - 1) * PAGE_SIZE
+        rows = tickets[skip:skip + PAGE_SIZE] if feed.available else open_tickets(db, skip, PAGE_SIZE, site)
+        st.dataframe([
+            {
+                "🕒": t['timestamp'],
+                "النوع": t['type'],
+                "الموظف": t['user_name'],
+                "الغرفة": t['user_room'],
+                "الطلب": t['item'],
+                "الحالة": f"👷 {t.get('assigned_to')}" if t['status'] == "InProgress" else "🟡 جديد",
+            }
+            for t in rows
+        ], hide_index=True, use_container_width=True)
+
+def ticket_card(t, buttons):
+    # buttons: [(label, callback, type), ...]
+    t_id = str(t['_id'])
+    with st.container(border=True):
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            st.subheader(f"📍 {t['user_room']}")
+            st.write(f"👤 **{t['user_name']}**")
+            st.info(f"☕ {t['item']}")
+            if t['details']: st.caption(t['details'])
+            # عرض الوقت عشان يعرف الطلب بقاله قد إيه
+            st.caption(f"🕒 {t['timestamp']}")
+        with c2:
+            st.write("")
+            st.write("")
+            for i, (label, callback, kind) in enumerate(buttons):
+                st.button(
+                    label, 
+                    key=f"btn_{t_id}_{i}", 
+                    type=kind, 
+                    on_click=callback, 
+                    args=(t_id,)
+                )
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def provider_queue(role_type):
+    with telemetry.rerun(), telemetry.section("provider_queue", user['role']):
+        # سلة المهملات المحلية (للاختفاء الفوري) - set بدل list
+        if 'trash_bin' not in st.session_state:
+            st.session_state['trash_bin'] = set()
+
+        def move_to_trash(ticket_id):
+            st.session_state['trash_bin'].add(ticket_id)
+            st.session_state['play_sound'] = True
+            update_ticket_status(db, ticket_id, "Done", provider=user['username'], site_id=site)
+
+        if st.session_state.pop('play_sound', False):
+            play_sound()
+
+        all_tickets = [t for t in live_tickets(role_type) if t['status'] == "New"]
+        # بنشيل من السلة أي تذكرة خرجت من الطابور خلاص، فالسلة حجمها مايعديش حجم الطابور
+        open_ids = {str(t['_id']) for t in all_tickets}
+        st.session_state['trash_bin'] &= open_ids
+        visible_tickets = [t for t in all_tickets if str(t['_id']) not in st.session_state['trash_bin']]
+
+        if not visible_tickets:
+            st.success("✅ كله تمام.. مفيش طلبات!")
+            st.image("https://media.giphy.com/media/26u4lOMA8JKSnL9Uk/giphy.gif", width=150)
+        else:
+            for t in visible_tickets:
+                ticket_card(t, [("تم ✅", move_to_trash, "primary")])
+
+# --- وضع التوزيع: كل مقدم خدمة بيستلم طلب ويقفله بنفسه ---
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def dispatch_panel(role_type, provider):
+    with telemetry.rerun(), telemetry.section("provider_queue", provider['role']):
+        name = provider['username']
+        rooms = dispatch.provider_rooms(db, provider)
+
+        def claim():
+            if dispatch.claim_next(db, role_type, name, rooms, site) is None:
+                st.session_state['claim_missed'] = True
+
+        def done(ticket_id):
+            dispatch.complete_ticket(db, ticket_id, name)
+            st.session_state['play_sound'] = True
+
+        def release(ticket_id):
+            dispatch.release_ticket(db, ticket_id, name)
+
+        if st.session_state.pop('play_sound', False):
+            play_sound()
+
+        open_tickets = live_tickets(role_type)
+        mine = [t for t in open_tickets if t['status'] == "InProgress" and t.get('assigned_to') == name]
+        waiting = [t for t in open_tickets if t['status'] == "New" and (not rooms or t['user_room'] in rooms)]
+
+        c1, c2 = st.columns(2)
+        c1.metric("في الانتظار", len(waiting))
+        c2.button("📥 استلام الطلب اللي عليه الدور", on_click=claim, disabled=not waiting, type="primary", use_container_width=True)
+        if st.session_state.pop('claim_missed', False):
+            st.info("حد تاني سبقك للطلب ده.. جرب تاني")
+        if rooms:
+            st.caption(f"📍 الغرف بتاعتك: {', '.join(rooms)}")
+
+        st.subheader("🧰 طلباتي")
+        if not mine:
+            st.success("✅ مفيش طلبات معاك دلوقتي")
+        for t in mine:
+            ticket_card(t, [("تم ✅", done, "primary"), ("↩️ رجوع", release, "secondary")])
+
+# --- تحليلات الأدمن (الأرقام + الرسومات) ---
+# بتتحسب مرة لكل (فرع، شهر، يوم، عرض، watermark) وتتشارك بين كل الأدمنز - ماتتعدلش بعد ما ترجع من الكاش
+def office_view(period):
+    off = analytics.type_report(db, period, "Office")
+    top_drinks = off['items'].copy()
+    top_drinks.columns = ['المشروب', 'العدد']
+    top_users = off['users'].copy()
+    top_users.columns = ['الموظف', 'العدد']
+    return {
+        **off,
+        "top_drinks": top_drinks,
+        "top_users": top_users,
+        "fig_drinks": px.bar(top_drinks, x='المشروب', y='العدد', color='العدد', text_auto=True),
+        "fig_users": px.bar(off['user_items'], x='user_name', y='count', color='item', title="تفاصيل طلبات كل موظف"),
+    }
+
+
+def it_view(period):
+    it = analytics.type_report(db, period, "IT")
+    top_issues = it['items'].copy()
+    top_issues.columns = ['المشكلة', 'العدد']
+    return {
+        **it,
+        "top_issues": top_issues,
+        "fig_issues": px.bar(top_issues, x='المشكلة', y='العدد', color='العدد', text_auto=True),
+        "fig_rooms": px.pie(it['rooms'], names='name', values='count', title="توزيع المشاكل على الغرف"),
+        "fig_users": px.bar(it['users'], x='name', y='count', title="الموظفين الأكثر تبليغاً"),
     }
-    db.tickets.insert_one(ticket)
 
-def update_ticket_status(ticket_id, status):
-    db.tickets.update_one({"_id": ObjectId(ticket_id)}, {"$set": {"status": status}})
 
-def toggle_stock(item_id, status):
-    db.menu.update_one({"_id": ObjectId(item_id)}, {"$set": {"available": status}})
+def cached_view(month, day, ticket_type):
+    period = analytics.period_match(month, day, site)
+    build = office_view if ticket_type == "Office" else it_view
+    return results.get((site, month, day, ticket_type), analytics.watermark(db, month, day, site), lambda: build(period))
+
+
+def service_section(month, day, ticket_type):
+    # زمن الخدمة من الـ histograms (مش من التذاكر)، وبيتحسب كل مرة لأنه بيتغير مع كل "تم"
+    stats = service_stats.report(db, analytics.period_match(month, day, site), ticket_type)
+    st.subheader("⏱️ زمن الخدمة (من الطلب لحد تم)")
+    if not stats.get("all"):
+        st.info("مفيش طلبات اتقفلت في الفترة دي")
+        return
+    overall = stats["all"][0]
+    c1, c2, c3 = st.columns(3)
+    c1.metric("اتقفل", overall['count'])
+    c2.metric("p50 (دقيقة)", overall['p50_min'])
+    c3.metric("p95 (دقيقة)", overall['p95_min'])
+    for tab, dimension in zip(st.tabs(["حسب الساعة", "حسب مقدم الخدمة", "حسب الغرفة"]), ["hour", "provider", "room"]):
+        with tab:
+            st.dataframe(stats.get(dimension, []), hide_index=True, use_container_width=True)
+
 
 # --- تسجيل الدخول ---
 def login():
@@ -109,7 +337,7 @@ def login():
     password = st.sidebar.text_input("كلمة السر", type="password")
     
     if st.sidebar.button("تسجيل دخول"):
-        user = get_user(username, password)
+        user = get_user(db, username, password)
         if user:
             user['_id'] = str(user['_id'])
             st.session_state['user'] = user
@@ -119,390 +347,428 @@ def login():
     return None
 
 # ==================== التطبيق الرئيسي ====================
-user = login()
-
-if user:
-    # القائمة الجانبية (معلومات المستخدم)
-    st.sidebar.divider()
-    st.sidebar.write(f"👤 **{user['name']}**")
-    st.sidebar.write(f"📍 **{user['room']}**")
+# try/finally: الـ rerun بيتسجل في التشخيص حتى لو خلص بـ st.rerun() أو st.stop() أو exception
+try:
+    with telemetry.section("login"):
+        user = login()
+
+    if user:
+        telemetry.set_role(user['role'])
+        # كل اللي تحت ده (المنيو، الغرف، الطوابير، التحليلات) على فرع المستخدم بس
+        site = site_of(user)
+        init_defaults(site)
+        # القائمة الجانبية (معلومات المستخدم)
+        st.sidebar.divider()
+        st.sidebar.write(f"👤 **{user['name']}**")
+        st.sidebar.write(f"📍 **{user['room']}** | 🏢 {site}")
     
-    # 🔄 زرار التحديث السريع (بديل F5)
-    if st.sidebar.button("🔄 تحديث البيانات", use_container_width=True):
-        st.rerun()
+        # 🔄 زرار التحديث السريع (بديل F5)
+        if st.sidebar.button("🔄 تحديث البيانات", use_container_width=True):
+            st.rerun()
 
-    # === القوائم الجانبية (Admin Only) ===
-    if user['role'] == "Admin":
+        # === القوائم الجانبية (Admin Only) ===
+        if user['role'] == "Admin":
         
-        # 1. إدارة المشروبات
-        with st.sidebar.expander("☕ إدارة المنيو", expanded=False):
-            # زرار التنظيف السحري
-            if st.button("🗑️ تنظيف وإعادة ضبط", help="يمسح التكرار ويرجع المنيو الأصلية"):
-                db.menu.delete_many({})
-                init_menu()
-                st.toast("تم تنظيف المنيو!")
-                time.sleep(1)
-                st.rerun()
-            
-            st.write("---")
-            st.write("المتاح حالياً:")
-            menu_items = list(db.menu.find())
-            for item in menu_items:
-                item_id = str(item['_id'])
-                is_available = st.checkbox(item['name'], value=item['available'], key=f"stock_{item_id}")
-                if is_available != item['available']:
-                    toggle_stock(item_id, is_available)
+            # 1. إدارة المشروبات
+            with st.sidebar.expander("☕ إدارة المنيو", expanded=False), telemetry.section("sidebar_menu"):
+                # زرار التنظيف السحري
+                if st.button("🗑️ تنظيف وإعادة ضبط", help="يمسح التكرار ويرجع المنيو الأصلية"):
+                    reset_menu(db, site)
+                    init_defaults.clear()
+                    init_defaults(site)
+                    st.toast("تم تنظيف المنيو!")
+                    time.sleep(1)
                     st.rerun()
             
-            st.write("---")
-            new_drink = st.text_input("صنف جديد")
-            if st.button("إضافة للمنيو"):
-                if new_drink and not db.menu.find_one({"name": new_drink.strip()}):
-                    db.menu.insert_one({"name": new_drink.strip(), "available": True})
-                    st.rerun()
+                st.write("---")
+                st.write("المتاح حالياً:")
+                menu_items = get_menu(db, site_id=site)
+                for item in menu_items:
+                    item_id = str(item['_id'])
+                    is_available = st.checkbox(item['name'], value=item['available'], key=f"stock_{item_id}")
+                    if is_available != item['available']:
+                        toggle_stock(db, item_id, is_available)
+                        st.rerun()
+            
+                st.write("---")
+                new_drink = st.text_input("صنف جديد")
+                if st.button("إضافة للمنيو"):
+                    if add_menu_item(db, new_drink.strip(), site):
+                        st.rerun()
 
-        # 2. إدارة الغرف (الجديد) 🆕
-        with st.sidebar.expander("🏢 إدارة الغرف (Teams)", expanded=False):
-            st.write("الغرف المسجلة:")
-            rooms_list = list(db.rooms.find())
-            for r in rooms_list:
-                c1, c2 = st.columns([3, 1])
-                c1.text(f"📍 {r['name']}")
-                if c2.button("❌", key=f"del_room_{r['_id']}"):
-                    db.rooms.delete_one({"_id": r['_id']})
-                    st.rerun()
+            # 2. إدارة الغرف (الجديد) 🆕
+            with st.sidebar.expander("🏢 إدارة الغرف (Teams)", expanded=False), telemetry.section("sidebar_rooms"):
+                st.write("الغرف المسجلة:")
+                rooms_list = get_rooms(db, site)
+                for r in rooms_list:
+                    c1, c2 = st.columns([3, 1])
+                    c1.text(f"📍 {r['name']}")
+                    if c2.button("❌", key=f"del_room_{r['_id']}"):
+                        delete_room(db, r['_id'])
+                        st.rerun()
             
-            st.write("---")
-            new_room = st.text_input("إضافة غرفة/تيم جديد")
-            if st.button("إضافة غرفة"):
-                if new_room and not db.rooms.find_one({"name": new_room.strip()}):
-                    db.rooms.insert_one({"name": new_room.strip()})
-                    st.success(f"تم إضافة {new_room}")
-                    time.sleep(1)
-                    st.rerun()
+                st.write("---")
+                new_room = st.text_input("إضافة غرفة/تيم جديد")
+                if st.button("إضافة غرفة"):
+                    if add_room(db, new_room.strip(), site):
+                        st.success(f"تم إضافة {new_room}")
+                        time.sleep(1)
+                        st.rerun()
 
-    # زرار الخروج
-    st.sidebar.divider()
-    if st.sidebar.button("تسجيل خروج", type="primary", use_container_width=True):
-        del st.session_state['user']
-        if 'trash_bin' in st.session_state:
-            del st.session_state['trash_bin']
-        st.rerun()
-
-    # ---------------------------------------------------------
-    # السيناريو الأول: الأدمن (Admin Dashboard)
-    # ---------------------------------------------------------
-    if user['role'] == "Admin":
-        st.title("📊 لوحة المدير العام")
-        admin_tabs = st.tabs(["📈 التحليلات المتقدمة", "📝 طلب سريع", "👥 إدارة الموظفين", "👀 المراقبة الحية"])
+        # زرار الخروج
+        st.sidebar.divider()
+        if st.sidebar.button("تسجيل خروج", type="primary", use_container_width=True):
+            del st.session_state['user']
+            if 'trash_bin' in st.session_state:
+                del st.session_state['trash_bin']
+            st.rerun()
+
+        # ---------------------------------------------------------
+        # السيناريو الأول: الأدمن (Admin Dashboard)
+        # ---------------------------------------------------------
+        if user['role'] == "Admin":
+            st.title("📊 لوحة المدير العام")
+            for w in schema_warnings:
+                st.warning(f"⚠️ Index: {w}")
+            admin_tabs = st.tabs(["📈 التحليلات المتقدمة", "📝 طلب سريع", "👥 إدارة الموظفين", "👀 المراقبة الحية", "🩺 التشخيص"])
         
-        # 1. التحليلات (Advanced Analytics)
-        with admin_tabs[0]:
-            all_data = list(db.tickets.find())
+            # 1. التحليلات (Advanced Analytics)
+            with admin_tabs[0], telemetry.section("analytics"):
+                # قائمة الشهور الموجودة (distinct بدل تحميل كل التذاكر)
+                unique_months = analytics.list_months(db, site)
             
-            if all_data:
-                df = pd.DataFrame(all_data)
-                
-                # تنظيف وتجهيز الداتا
-                df['datetime'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                if 'month_year' not in df.columns:
-                    df['month_year'] = df['datetime'].dt.strftime('%Y-%m')
-                # تنظيف اسم المشروب (قهوة - سكر زيادة => قهوة)
-                df['item_clean'] = df['item'].apply(lambda x: x.split('-')[0].strip() if '-' in str(x) else str(x))
-
-                # --- الفلاتر (Filters) ---
-                st.subheader("📅 فلترة التقرير")
-                col_m, col_d = st.columns(2)
+                if unique_months:
+                    # --- الفلاتر (Filters) ---
+                    st.subheader("📅 فلترة التقرير")
+                    col_m, col_d = st.columns(2)
                 
-                # قائمة الشهور الموجودة
-                unique_months = sorted([m for m in df['month_year'].dropna().unique() if isinstance(m, str)], reverse=True)
-                selected_month = col_m.selectbox("1️⃣ اختر الشهر:", unique_months)
+                    selected_month = col_m.selectbox("1️⃣ اختر الشهر:", unique_months)
                 
-                # فلترة مبدئية
-                month_df = df[df['month_year'] == selected_month]
+                    # قائمة الأيام في الشهر ده
+                    available_days = analytics.list_days(db, selected_month, site)
+                    day_options = [analytics.ALL_DAYS] + available_days
+                    selected_day = col_d.selectbox("2️⃣ اختر اليوم:", day_options)
                 
-                # قائمة الأيام في الشهر ده
-                available_days = sorted(month_df['date_only'].unique())
-                day_options = ["الكل (الشهر بالكامل)"] + list(available_days)
-                selected_day = col_d.selectbox("2️⃣ اختر اليوم:", day_options)
-                
-                # الفلترة النهائية
-                if selected_day != "الكل (الشهر بالكامل)":
-                    final_df = month_df[month_df['date_only'] == selected_day]
-                    report_label = f"يوم {selected_day}"
-                else:
-                    final_df = month_df
-                    report_label = f"شهر {selected_month}"
+                    if selected_day != analytics.ALL_DAYS:
+                        report_label = f"يوم {selected_day}"
+                    else:
+                        report_label = f"شهر {selected_month}"
                 
-                if not final_df.empty:
-                    st.divider()
+                    if available_days:
+                        st.divider()
                     
-                    # زرار التبديل (Toggle View)
-                    view_mode = st.radio("اختر نوع العرض:", ["☕ تحليلات البوفيه", "💻 تحليلات الـ IT"], horizontal=True)
-                    st.divider()
+                        # زرار التبديل (Toggle View)
+                        view_mode = st.radio("اختر نوع العرض:", ["☕ تحليلات البوفيه", "💻 تحليلات الـ IT"], horizontal=True)
+                        st.divider()
 
-                    # ==================== (أ) عرض البوفيه ====================
-                    if view_mode == "☕ تحليلات البوفيه":
-                        off_df = final_df[final_df['type'] == "Office"]
+                        # ==================== (أ) عرض البوفيه ====================
+                        if view_mode == "☕ تحليلات البوفيه":
+                            off = cached_view(selected_month, selected_day, "Office")
                         
-                        if not off_df.empty:
-                            # كروت المعلومات (KPIs)
-                            c1, c2, c3 = st.columns(3)
-                            c1.metric("عدد المشروبات", len(off_df))
-                            c2.metric("المشروب المفضل", off_df['item_clean'].mode()[0] if not off_df.empty else "-")
-                            c3.metric("الغرفة الأكيلة", off_df['user_room'].mode()[0] if not off_df.empty else "-")
+                            if off['total']:
+                                # كروت المعلومات (KPIs)
+                                c1, c2, c3 = st.columns(3)
+                                c1.metric("عدد المشروبات", off['total'])
+                                c2.metric("المشروب المفضل", analytics.top_name(off['items']))
+                                c3.metric("الغرفة الأكيلة", analytics.top_name(off['rooms']))
                             
-                            st.divider()
-
-                            # 1. تحليل الأصناف (Top Drinks)
-                            st.subheader("🏆 المشروبات الأكثر طلباً")
-                            top_drinks = off_df['item_clean'].value_counts().reset_index()
-                            top_drinks.columns = ['المشروب', 'العدد']
-                            
-                            c_chart, c_table = st.columns([2, 1])
-                            with c_chart:
-                                
-                                fig = px.bar(top_drinks, x='المشروب', y='العدد', color='العدد', text_auto=True)
-                                st.plotly_chart(fig, use_container_width=True)
-                            with c_table:
-                                st.dataframe(top_drinks, hide_index=True, use_container_width=True)
+                                st.divider()
+
+                                # 1. تحليل الأصناف (Top Drinks)
+                                st.subheader("🏆 المشروبات الأكثر طلباً")
+                                c_chart, c_table = st.columns([2, 1])
+                                with c_chart:
+                                    st.plotly_chart(off['fig_drinks'], use_container_width=True)
+                                with c_table:
+                                    st.dataframe(off['top_drinks'], hide_index=True, use_container_width=True)
                             
-                            st.divider()
-
-                            # 2. تحليل الموظفين (User Behavior)
-                            st.subheader("👥 استهلاك الموظفين")
-                            c_p1, c_p2 = st.columns([2, 1])
-                            with c_p1:
-                                # Stacked Bar Chart (مين طلب إيه)
-                                fig_users = px.bar(off_df, x='user_name', color='item_clean', title="تفاصيل طلبات كل موظف")
-                                st.plotly_chart(fig_users, use_container_width=True)
-                            with c_p2:
-                                top_users = off_df['user_name'].value_counts().reset_index()
-                                top_users.columns = ['الموظف', 'العدد']
-                                st.dataframe(top_users, hide_index=True)
-
-                        else:
-                            st.warning(f"مفيش طلبات بوفيه في {report_label}")
-
-                    # ==================== (ب) عرض الـ IT ====================
-                    elif view_mode == "💻 تحليلات الـ IT":
-                        it_df = final_df[final_df['type'] == "IT"]
+                                st.divider()
+
+                                # 2. تحليل الموظفين (User Behavior)
+                                st.subheader("👥 استهلاك الموظفين")
+                                c_p1, c_p2 = st.columns([2, 1])
+                                with c_p1:
+                                    # Stacked Bar Chart (مين طلب إيه)
+                                    st.plotly_chart(off['fig_users'], use_container_width=True)
+                                with c_p2:
+                                    st.dataframe(off['top_users'], hide_index=True)
+
+                                st.divider()
+                                service_section(selected_month, selected_day, "Office")
+
+                            else:
+                                st.warning(f"مفيش طلبات بوفيه في {report_label}")
+
+                        # ==================== (ب) عرض الـ IT ====================
+                        elif view_mode == "💻 تحليلات الـ IT":
+                            it = cached_view(selected_month, selected_day, "IT")
                         
-                        if not it_df.empty:
-                            # KPIs
-                            c1, c2, c3 = st.columns(3)
-                            c1.metric("إجمالي البلاغات", len(it_df))
-                            c2.metric("أكثر مشكلة", it_df['item'].mode()[0] if not it_df.empty else "-")
-                            c3.metric("أكثر قسم بيشتكي", it_df['user_room'].mode()[0] if not it_df.empty else "-")
-                            
-                            st.divider()
-
-                            # 1. تحليل المشاكل
-                            st.subheader("🔧 المشاكل الشائعة")
-                            top_issues = it_df['item'].value_counts().reset_index()
-                            top_issues.columns = ['المشكلة', 'العدد']
+                            if it['total']:
+                                # KPIs
+                                c1, c2, c3 = st.columns(3)
+                                c1.metric("إجمالي البلاغات", it['total'])
+                                c2.metric("أكثر مشكلة", analytics.top_name(it['items']))
+                                c3.metric("أكثر قسم بيشتكي", analytics.top_name(it['rooms']))
                             
-                            c_chart, c_table = st.columns([2, 1])
-                            with c_chart:
-                                fig = px.bar(top_issues, x='المشكلة', y='العدد', color='العدد', text_auto=True)
-                                st.plotly_chart(fig, use_container_width=True)
-                            with c_table:
-                                st.dataframe(top_issues, hide_index=True, use_container_width=True)
+                                st.divider()
+
+                                # 1. تحليل المشاكل
+                                st.subheader("🔧 المشاكل الشائعة")
+                                c_chart, c_table = st.columns([2, 1])
+                                with c_chart:
+                                    st.plotly_chart(it['fig_issues'], use_container_width=True)
+                                with c_table:
+                                    st.dataframe(it['top_issues'], hide_index=True, use_container_width=True)
                             
-                            st.divider()
-
-                            # 2. تحليل الأقسام (Rooms)
-                            st.subheader("🏢 مصدر البلاغات")
-                            col_pie, col_bar = st.columns(2)
-                            with col_pie:
-                                fig_pie = px.pie(it_df, names='user_room', title="توزيع المشاكل على الغرف")
-                                st.plotly_chart(fig_pie, use_container_width=True)
-                            with col_bar:
-                                fig_bar = px.bar(it_df['user_name'].value_counts().reset_index(), x='index', y='user_name', title="الموظفين الأكثر تبليغاً")
-                                st.plotly_chart(fig_bar, use_container_width=True)
+                                st.divider()
 
-                        else:
-                            st.warning(f"مفيش بلاغات IT في {report_label}")
+                                # 2. تحليل الأقسام (Rooms)
+                                st.subheader("🏢 مصدر البلاغات")
+                                col_pie, col_bar = st.columns(2)
+                                with col_pie:
+                                    st.plotly_chart(it['fig_rooms'], use_container_width=True)
+                                with col_bar:
+                                    st.plotly_chart(it['fig_users'], use_container_width=True)
 
-                    st.divider()
+                                st.divider()
+                                service_section(selected_month, selected_day, "IT")
+
+                            else:
+                                st.warning(f"مفيش بلاغات IT في {report_label}")
+
+                        st.divider()
                     
-                    # === (ج) منطقة العمليات الخطرة (Data Management) ===
-                    st.subheader("⚙️ إدارة البيانات")
-                    col_act1, col_act2 = st.columns(2)
+                        # === (ج) منطقة العمليات الخطرة (Data Management) ===
+                        st.subheader("⚙️ إدارة البيانات")
+                        col_act1, col_act2 = st.columns(2)
                     
-                    with col_act1:
-                        # تحميل التقرير
-                        csv = final_df.to_csv(index=False).encode('utf-8-sig')
-                        st.download_button(
-                            label=f"📥 تحميل تقرير {report_label} (Excel)",
-                            data=csv,
-                            file_name=f"report_{selected_month}.csv",
-                            mime="text/csv",
-                        )
+                        with col_act1:
+                            # تحميل التقرير (الملف بيتعمل بس لما حد يدوس تحميل، بالـ streaming من الـ Mongo)
+                            export_format = st.radio("صيغة الملف", ["csv", "parquet"], horizontal=True, key="export_format")
+                            report_period = analytics.period_range(selected_month, selected_day, site)
+                            st.download_button(
+                                label=f"📥 تحميل تقرير {report_label} ({'Excel' if export_format == 'csv' else 'Parquet'})",
+                                data=lambda period=report_period, fmt=export_format: report_bytes(period, fmt),
+                                file_name=f"report_{selected_day if selected_day != analytics.ALL_DAYS else selected_month}.{export_format}",
+                                mime=export.MIME_TYPES[export_format],
+                                on_click="ignore",
+                            )
                     
-                    with col_act2:
-                        # تصفير السيستم (مسح كل التذاكر القديمة)
-                        with st.expander("🚨 تصفير السيستم بالكامل (Reset All)"):
-                            st.error("تحذير: الزرار ده هيمسح **كل التذاكر** في الداتا بيز (قديم وجديد)!")
-                            confirm_reset = st.checkbox("أنا متأكد، امسح كل حاجة وابدأ من الصفر")
-                            if st.button("تنفيذ التصفير الشامل 🧨", disabled=not confirm_reset):
-                                db.tickets.delete_many({}) # حذف كل المستندات في tickets
-                                st.success("تم تصفير السيستم بنجاح! 🧹")
-                                time.sleep(2)
-                                st.rerun()
+                        with col_act2:
+                            # أرشفة الطلبات الـ Done القديمة (التقارير بتفضل زي ما هي)
+                            with st.expander("📦 أرشفة الطلبات القديمة"):
+                                archive_days = st.number_input(
+                                    "أرشفة الطلبات المنتهية الأقدم من (يوم)", min_value=1,
+                                    value=st.secrets.get("archive", {}).get("older_than_days", archive.ARCHIVE_AFTER_DAYS),
+                                )
+                                if st.button("نقل للأرشيف 📦"):
+                                    moved = archive.archive_done(db, int(archive_days), site_id=site)
+                                    st.success(f"تم نقل {moved} طلب للأرشيف")
+
+                            # تصفير السيستم (مسح كل التذاكر القديمة)
+                            with st.expander("🚨 تصفير السيستم بالكامل (Reset All)"):
+                                st.error(f"تحذير: الزرار ده هيمسح **كل تذاكر فرع {site}** (قديم وجديد والأرشيف)!")
+                                confirm_reset = st.checkbox("أنا متأكد، امسح كل حاجة وابدأ من الصفر")
+                                if st.button("تنفيذ التصفير الشامل 🧨", disabled=not confirm_reset):
+                                    db.tickets.delete_many({"site_id": site}) # حذف كل تذاكر الفرع
+                                    archive.drop_all(db, site)
+                                    rollups.reset(db, site)
+                                    service_stats.reset(db, site)
+                                    st.success("تم تصفير السيستم بنجاح! 🧹")
+                                    time.sleep(2)
+                                    st.rerun()
 
+                    else:
+                        st.info("مفيش بيانات في الفترة اللي اخترتها")
                 else:
-                    st.info("مفيش بيانات في الفترة اللي اخترتها")
-            else:
-                st.info("السيستم لسه فاضي تماماً")
-
-        # 2. طلب خاص للأدمن
-        with admin_tabs[1]:
-            type_ = st.radio("نوع الطلب", ["بوفيه", "IT"], horizontal=True)
-            if type_ == "بوفيه":
-                available_drinks = [d['name'] for d in db.menu.find({"available": True})]
-                if available_drinks:
+                    st.info("السيستم لسه فاضي تماماً")
+
+            # 2. طلب خاص للأدمن
+            with admin_tabs[1], telemetry.section("admin_order"):
+                type_ = st.radio("نوع الطلب", ["بوفيه", "IT"], horizontal=True)
+                if type_ == "بوفيه":
+                    available_drinks = [d['name'] for d in get_menu(db, available_only=True, site_id=site)]
+                    if available_drinks:
+                        c1, c2 = st.columns(2)
+                        item = c1.selectbox("الصنف", available_drinks)
+                        sugar = c1.selectbox("السكر", ["سادة", "مظبوط", "زيادة", "معلقة"])
+                        notes = c2.text_input("ملاحظات")
+                        if st.button("اطلب ☕"):
+                            add_ticket(db, user, "Office", f"{item} - {sugar}", notes, drink=item, sugar=sugar,
+                                       client_key=order_key("admin_office", item, sugar, notes), buffer=order_buffer)
+                            st.toast("تم!")
+                else:
+                    issue = st.selectbox("المشكلة", ["نت", "أخرى", "PC"])
+                    if st.button("بلغ IT"):
+                        add_ticket(db, user, "IT", issue, "", issue=issue, client_key=order_key("admin_it", issue), buffer=order_buffer)
+                        st.toast("تم")
+
+            # 3. إدارة الموظفين (مع اختيار الغرف)
+            with admin_tabs[2], telemetry.section("employees"):
+                st.subheader("إضافة موظف جديد")
+                with st.form("new_user"):
                     c1, c2 = st.columns(2)
-                    item = c1.selectbox("الصنف", available_drinks)
-                    sugar = c1.selectbox("السكر", ["سادة", "مظبوط", "زيادة", "معلقة"])
-                    notes = c2.text_input("ملاحظات")
-                    if st.button("اطلب ☕"):
-                        add_ticket(user, "Office", f"{item} - {sugar}", notes)
-                        st.toast("تم!")
-            else:
-                issue = st.selectbox("المشكلة", ["نت", "أخرى", "PC"])
-                if st.button("بلغ IT"):
-                    add_ticket(user, "IT", issue, "")
-                    st.toast("تم")
-
-        # 3. إدارة الموظفين (مع اختيار الغرف)
-        with admin_tabs[2]:
-            st.subheader("إضافة موظف جديد")
-            with st.form("new_user"):
-                c1, c2 = st.columns(2)
-                name = c1.text_input("الاسم")
-                uname = c2.text_input("اليوزر")
+                    name = c1.text_input("الاسم")
+                    uname = c2.text_input("اليوزر")
                 
-                c3, c4 = st.columns(2)
-                pwd = c3.text_input("باسورد", type="password")
+                    c3, c4 = st.columns(2)
+                    pwd = c3.text_input("باسورد", type="password")
                 
-                # جلب الغرف المتاحة
-                available_rooms = [r['name'] for r in db.rooms.find()]
-                if not available_rooms: available_rooms = ["General"]
-                room = c4.selectbox("المكتب / التيم", available_rooms)
+                    # جلب الغرف المتاحة
+                    available_rooms = [r['name'] for r in get_rooms(db, site)]
+                    if not available_rooms: available_rooms = ["General"]
+                    room = c4.selectbox("المكتب / التيم", available_rooms)
                 
-                role_map = {"موظف": "Employee", "بوفيه": "Office Boy", "IT": "IT Support", "مدير": "Admin"}
-                role_ar = st.selectbox("الوظيفة", list(role_map.keys()))
+                    role_map = {"موظف": "Employee", "بوفيه": "Office Boy", "IT": "IT Support", "مدير": "Admin"}
+                    role_ar = st.selectbox("الوظيفة", list(role_map.keys()))
                 
-                if st.form_submit_button("حفظ الموظف"):
-                    if not db.users.find_one({"username": uname}):
-                        db.users.insert_one({"name": name, "username": uname, "password": pwd, "room": room, "role": role_map[role_ar]})
-                        st.success("تم")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error("اليوزر ده موجود قبل كده")
-            
-            st.divider()
-            st.write("📋 الموظفين الحاليين:")
-            for u in db.users.find():
-                c1, c2, c3 = st.columns([2, 2, 1])
-                c1.text(f"{u['name']} ({u['role']})")
-                c2.text(u['room'])
-                if c3.button("حذف", key=u['username']):
-                    db.users.delete_one({"_id": u['_id']})
-                    st.rerun()
+                    if st.form_submit_button("حفظ الموظف"):
+                        if add_user(db, name, uname, pwd, room, role_map[role_ar], site):
+                            st.success("تم")
+                            time.sleep(1)
+                            st.rerun()
+                        else:
+                            st.error("اليوزر ده موجود قبل كده")
+
+                # استيراد / تصدير بالجملة (ملف واحد بدل فورم لكل موظف)
+                with st.expander("📥 استيراد / تصدير (CSV / Excel)"):
+                    bulk_kinds = {"الموظفين": "users", "الغرف": "rooms", "المنيو": "menu"}
+                    bulk_kind = bulk_kinds[st.radio("البيانات", list(bulk_kinds), horizontal=True, key="bulk_kind")]
+                    st.caption(f"الأعمدة: {', '.join(bulk_io.COLUMNS[bulk_kind])} (استورد الغرف قبل الموظفين)")
+                    upload = st.file_uploader("الملف", type=list(bulk_io.FORMATS), key=f"bulk_upload_{bulk_kind}")
+                    if upload is not None:
+                        c1, c2 = st.columns(2)
+                        check = c1.button("🔍 مراجعة الملف")
+                        apply = c2.button("📥 استيراد", type="primary")
+                        if check or apply:
+                            try:
+                                report = bulk_io.import_rows(db, bulk_kind, bulk_io.read_rows(upload, upload.name), dry_run=not apply, site_id=site)
+                            except (ValueError, ImportError) as e:
+                                st.error(f"الملف مش مقروء: {e}")
+                            else:
+                                st.info(f"جديد: {report['inserted']} | تعديل: {report['updated']} | أخطاء: {len(report['errors'])}")
+                                if report['errors']:
+                                    st.dataframe([{"الصف": n, "الغلط": e} for n, e in report['errors']], hide_index=True)
 
-        # 4. مراقبة الطلبات (مع الوقت والتاريخ)
-        with admin_tabs[3]:
-            if st.button("تحديث القائمة"): st.rerun()
-            
-            tickets = list(db.tickets.find({"status": "New"}))
-            if not tickets:
-                st.success("الجو رايق.. مفيش طلبات معلقة.")
-            
-            for t in tickets:
-                # عرض الوقت والتاريخ بشكل واضح
-                msg = f"🕒 **{t['timestamp']}** | {t['type']} | **{t['user_name']}** ({t['user_room']}) : {t['item']}"
-                st.warning(msg)
-
-    # ---------------------------------------------------------
-    # السيناريو الثاني: الموظف (Employee)
-    # ---------------------------------------------------------
-    elif user['role'] == "Employee":
-        st.title(f"أهلاً 👋 {user['name'].split()[0]}")
-        tabs = st.tabs(["☕ طلب بوفيه", "💻 دعم فني"])
-        
-        with tabs[0]:
-            available_drinks = [d['name'] for d in db.menu.find({"available": True})]
-            if available_drinks:
-                c1, c2 = st.columns(2)
-                item = c1.selectbox("هتشرب إيه؟", available_drinks)
-                sugar = c1.selectbox("السكر", ["سادة", "على الريحة", "مظبوط", "زيادة", "معلقة", "2 معلقة", "3 معالق"])
-                notes = c2.text_input("ملاحظات")
-                if st.button("اطلب 🚀", use_container_width=True):
-                    add_ticket(user, "Office", f"{item} - {sugar}", notes)
-                    st.success("تم الإرسال!")
-            else:
-                st.error("البوفيه مغلق")
-
-        with tabs[1]:
-            issue = st.selectbox("المشكلة", ["نت", "أخرى", "PC", "برامج"])
-            desc = st.text_area("وصف")
-            if st.button("بلغ IT 🛠️", use_container_width=True):
-                add_ticket(user, "IT", issue, desc)
-                st.success("تم التبليغ")
-
-    # ---------------------------------------------------------
-    # السيناريو الثالث: مقدمي الخدمة (Office Boy & IT Support)
-    # ---------------------------------------------------------
-    elif user['role'] in ["Office Boy", "IT Support"]:
-        role_type = "Office" if user['role'] == "Office Boy" else "IT"
-        st.header(f"📋 طلبات {role_type} (مباشر)")
-
-        # سلة المهملات المحلية (للاختفاء الفوري)
-        if 'trash_bin' not in st.session_state:
-            st.session_state['trash_bin'] = []
+                    st.divider()
+                    bulk_format = st.radio("صيغة التصدير", list(bulk_io.FORMATS), horizontal=True, key="bulk_format")
+                    if st.button("📤 تجهيز ملف التصدير"):
+                        st.download_button(
+                            label=f"📥 تحميل {bulk_kind}.{bulk_format}",
+                            data=bulk_io.to_bytes(bulk_io.export_rows(db, bulk_kind, site), bulk_kind, bulk_format),
+                            file_name=f"{bulk_kind}.{bulk_format}",
+                            mime=bulk_io.MIME_TYPES[bulk_format],
+                            on_click="ignore",
+                        )
 
-        def move_to_trash(ticket_id):
-            st.session_state['trash_bin'].append(ticket_id)
-            play_sound()
-            update_ticket_status(ticket_id, "Done")
+                st.divider()
+                st.write("📋 الموظفين الحاليين:")
+                # صفحات من السيرفر: users_pages فيها آخر username قبل كل صفحة (None = أول صفحة)
+                users_search = st.text_input("🔎 بحث بأول الاسم أو اليوزر أو الغرفة", key="users_search",
+                                             on_change=lambda: st.session_state.pop("users_pages", None)).strip()
+                users_pages = st.session_state.setdefault("users_pages", [None])
+                page_users, has_more = search_users(db, users_search, users_pages[-1], site_id=site)
+                users_table = st.dataframe(
+                    [{"الاسم": u['name'], "اليوزر": u['username'], "الغرفة": u['room'], "الوظيفة": u['role']} for u in page_users],
+                    hide_index=True, use_container_width=True, on_select="rerun", selection_mode="multi-row",
+                    key=f"users_table_{users_search}_{len(users_pages)}",
+                )
+                selected_users = [page_users[i] for i in users_table.selection.rows]
+                c1, c2, c3 = st.columns([1, 1, 2])
+                if c1.button("⬅️ السابق", disabled=len(users_pages) == 1):
+                    users_pages.pop()
+                    st.rerun()
+                if c2.button("التالي ➡️", disabled=not has_more):
+                    users_pages.append(page_users[-1]['username'])
+                    st.rerun()
+                if c3.button(f"🗑️ حذف المحددين ({len(selected_users)})", disabled=not selected_users):
+                    for u in selected_users:
+                        delete_user(db, u['_id'])
+                    st.rerun()
 
-        all_tickets = list(db.tickets.find({"type": role_type, "status": "New"}))
-        visible_tickets = [t for t in all_tickets if str(t['_id']) not in st.session_state['trash_bin']]
+            # 4. مراقبة الطلبات (مع الوقت والتاريخ)
+            with admin_tabs[3]:
+                if st.button("تحديث القائمة"): st.rerun()
+                live_monitor()
 
-        if not visible_tickets:
-            st.success("✅ كله تمام.. مفيش طلبات!")
-            st.image("https://media.giphy.com/media/26u4lOMA8JKSnL9Uk/giphy.gif", width=150)
-            time.sleep(1)
-            st.rerun()
-        else:
-            for t in visible_tickets:
-                t_id = str(t['_id'])
-                with st.container(border=True):
-                    c1, c2 = st.columns([3, 1])
-                    with c1:
-                        st.subheader(f"📍 {t['user_room']}")
-                        st.write(f"👤 **{t['user_name']}**")
-                        st.info(f"☕ {t['item']}")
-                        if t['details']: st.caption(t['details'])
-                        # عرض الوقت عشان يعرف الطلب بقاله قد إيه
-                        st.caption(f"🕒 {t['timestamp']}")
-                    with c2:
-                        st.write("")
-                        st.write("")
-                        st.button(
-                            "تم ✅", 
-                            key=f"btn_{t_id}", 
-                            type="primary", 
-                            on_click=move_to_trash, 
-                            args=(t_id,)
-                        )
-            time.sleep(1)
-            st.rerun()
+            # 5. التشخيص (أوامر الـ Mongo وزمن كل جزء لكل دور)
+            with admin_tabs[4]:
+                snap = telemetry.snapshot()
+                c1, c2 = st.columns(2)
+                if c1.button("🧹 تصفير العدادات"):
+                    telemetry.reset()
+                    st.rerun()
+                c2.download_button("📤 تصدير Prometheus", telemetry.prometheus(), file_name="itqan.prom", mime="text/plain", on_click="ignore")
+
+                st.subheader("🗄️ أوامر الـ Mongo")
+                st.dataframe([
+                    {**c, "avg_ms": round(c['seconds'] * 1000 / c['count'], 2), "docs_per_command": round(c['documents'] / c['count'], 1)}
+                    for c in snap['commands']
+                ], hide_index=True, use_container_width=True)
+
+                st.subheader("⏱️ زمن الأجزاء")
+                st.dataframe([
+                    {**x, "avg_ms": round(x['seconds'] * 1000 / x['runs'], 2), "max_ms": round(x['max_seconds'] * 1000, 2)}
+                    for x in snap['sections']
+                ], hide_index=True, use_container_width=True)
+
+                st.subheader("📦 كاش التحليلات")
+                st.json(results.stats())
+
+                if order_buffer is not None:
+                    st.subheader("📨 كتابة الطلبات على دفعات")
+                    st.json(order_buffer.stats())
+
+                st.subheader("🔁 آخر الـ Reruns")
+                st.dataframe([
+                    {"role": r['role'], "ms": round(r['seconds'] * 1000, 1), "commands": r['commands'], "documents": r['documents'],
+                     "sections": ", ".join(f"{k}: {v.get('commands', 0)}" for k, v in r['sections'].items())}
+                    for r in reversed(snap['recent'])
+                ], hide_index=True, use_container_width=True)
+
+        # ---------------------------------------------------------
+        # السيناريو الثاني: الموظف (Employee)
+        # ---------------------------------------------------------
+        elif user['role'] == "Employee":
+            st.title(f"أهلاً 👋 {user['name'].split()[0]}")
+            tabs = st.tabs(["☕ طلب بوفيه", "💻 دعم فني"])
+        
+            with tabs[0], telemetry.section("employee_order"):
+                available_drinks = [d['name'] for d in get_menu(db, available_only=True, site_id=site)]
+                if available_drinks:
+                    c1, c2 = st.columns(2)
+                    item = c1.selectbox("هتشرب إيه؟", available_drinks)
+                    sugar = c1.selectbox("السكر", ["سادة", "على الريحة", "مظبوط", "زيادة", "معلقة", "2 معلقة", "3 معالق"])
+                    notes = c2.text_input("ملاحظات")
+                    if st.button("اطلب 🚀", use_container_width=True):
+                        add_ticket(db, user, "Office", f"{item} - {sugar}", notes, drink=item, sugar=sugar,
+                                   client_key=order_key("office", item, sugar, notes), buffer=order_buffer)
+                        st.success("تم الإرسال!")
+                else:
+                    st.error("البوفيه مغلق")
+
+            with tabs[1], telemetry.section("employee_it"):
+                issue = st.selectbox("المشكلة", ["نت", "أخرى", "PC", "برامج"])
+                desc = st.text_area("وصف")
+                if st.button("بلغ IT 🛠️", use_container_width=True):
+                    add_ticket(db, user, "IT", issue, desc, issue=issue, client_key=order_key("it", issue, desc), buffer=order_buffer)
+                    st.success("تم التبليغ")
+
+        # ---------------------------------------------------------
+        # السيناريو الثالث: مقدمي الخدمة (Office Boy & IT Support)
+        # ---------------------------------------------------------
+        elif user['role'] in ["Office Boy", "IT Support"]:
+            role_type = "Office" if user['role'] == "Office Boy" else "IT"
+            st.header(f"📋 طلبات {role_type} (مباشر)")
+
+            if DISPATCH_MODE:
+                dispatch_panel(role_type, user)
+            else:
+                provider_queue(role_type)
 
-else:
-    st.info("سجل دخول")
+    else:
+        st.info("سجل دخول")
+finally:
+    telemetry.end_rerun()
 
 
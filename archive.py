@@ -0,0 +1,86 @@
+import argparse
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+# --- أرشفة التذاكر (Hot / Archive) ---
+# التذاكر الـ Done الأقدم من مدة معينة بتتنقل على دفعات لكوليكشن أرشيف لكل شهر (tickets_archive_2024_05)
+# فالطوابير والمراقبة بتشتغل على tickets الصغيرة بس، والتحليلات بتقرا من ticket_rollups اللي مابتتمسحش
+
+ARCHIVE_PREFIX = "tickets_archive_"
+ARCHIVE_AFTER_DAYS = 90
+BATCH_SIZE = 1000
+
+
+def archive_name(month):
+    return ARCHIVE_PREFIX + month.replace("-", "_")
+
+
+def archived_months(db):
+    names = db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+    return sorted(n[len(ARCHIVE_PREFIX):].replace("_", "-") for n in names)
+
+
+def collections_between(db, start=None, end=None):
+    # الكوليكشنز اللي ممكن يكون فيها تذاكر في الفترة [start, end) - الأرشيف الأقدم الأول وبعده tickets
+    collections = []
+    for month in archived_months(db):
+        month_start = datetime.strptime(month, "%Y-%m")
+        month_end = datetime(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        if (end is None or month_start < end) and (start is None or month_end > start):
+            collections.append(db[archive_name(month)])
+    return collections + [db.tickets]
+
+
+def collections_for(db, match):
+    # نفس اللي فوق بس من فلتر created_at ({"$gte": ..., "$lt": ...})
+    period = match.get("created_at") or {}
+    return collections_between(db, period.get("$gte"), period.get("$lt"))
+
+
+def archive_done(db, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, site_id=None):
+    # site_id: تذاكر فرع واحد بس (أدمن الفرع من التطبيق)، و None لكل الفروع (cron)
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    query = {"status": "Done", "created_at": {"$lt": cutoff}}
+    if site_id is not None:
+        query["site_id"] = site_id
+    moved = 0
+    while True:
+        batch = list(db.tickets.find(query).sort("created_at", ASCENDING).limit(batch_size))
+        if not batch:
+            return moved
+        by_month = {}
+        for t in batch:
+            by_month.setdefault(t['created_at'].strftime("%Y-%m"), []).append(t)
+        for month, tickets in by_month.items():
+            target = db[archive_name(month)]
+            target.create_index([("created_at", ASCENDING)])
+            try:
+                target.insert_many(tickets, ordered=False)
+            except BulkWriteError as e:
+                # لو دفعة سابقة اتقطعت بعد الـ insert وقبل الـ delete: التكرار عادي، أي غلط تاني لأ
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        db.tickets.delete_many({"_id": {"$in": [t['_id'] for t in batch]}, "status": "Done"})
+        moved += len(batch)
+
+
+def drop_all(db, site_id=None):
+    # site_id: مسح تذاكر فرع واحد بس من كل الشهور
+    for month in archived_months(db):
+        if site_id is None:
+            db.drop_collection(archive_name(month))
+        else:
+            db[archive_name(month)].delete_many({"site_id": site_id})
+
+
+if __name__ == "__main__":
+    import data
+
+    parser = argparse.ArgumentParser(description="نقل التذاكر الـ Done القديمة للأرشيف الشهري")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="أقدم من كام يوم")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    parser.add_argument("--site", help="site_id (من غيره: كل الفروع)")
+    args = parser.parse_args()
+
+    print(f"archived {archive_done(data.get_db(), args.days, args.batch, args.site)} tickets")
@@ -0,0 +1,355 @@
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pymongo
+from pymongo import monitoring
+import analytics
+import api
+import data
+import rollups
+import schema
+from live_queue import TicketFeed, OPEN_STATUSES
+from order_buffer import OrderBuffer
+from refcache import cache
+
+# --- Benchmark لمسار الطلبات والتوزيع والتحليلات ---
+# بيشغل نفس دوال الداتا اللي بيستخدمها app.py على mongod محلي وداتا بيز مؤقتة (الفرع الافتراضي)
+# والنتيجة JSON عشان نقارن بين النسخ
+
+
+class CommandCounter(monitoring.CommandListener):
+    # بيعد أوامر الـ Mongo اللي اتبعتت من الـ thread الحالي جوه measure()
+    def __init__(self):
+        self._local = threading.local()
+
+    def started(self, event):
+        counts = getattr(self._local, "counts", None)
+        if counts is not None:
+            counts[event.command_name] = counts.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    @contextmanager
+    def measure(self):
+        self._local.counts = {}
+        try:
+            yield self._local.counts
+        finally:
+            self._local.counts = None
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "n": 0}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0], "n": 1}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "n": len(values)}
+
+
+# --- الداتا الوهمية ---
+SITE = data.DEFAULT_SITE
+
+
+def seed(db, employees, rooms, force=False):
+    data.check_scratch_db(db.name, force)
+    db.client.drop_database(db.name)
+    for name in ("menu", "rooms", "users"):
+        cache.invalidate(name)
+    schema.ensure_indexes(db)
+    data.seed_menu(db)
+    room_names = [f"Room {i}" for i in range(rooms)]
+    db.rooms.insert_many([{"site_id": SITE, "name": r} for r in room_names])
+    users = [
+        {"site_id": SITE, "name": f"Employee {i}", "username": f"emp{i}", "password": "x", "room": random.choice(room_names), "role": "Employee"}
+        for i in range(employees)
+    ]
+    db.users.insert_many(users)
+    return users
+
+
+def random_order(db):
+    drinks = [d['name'] for d in data.get_menu(db, available_only=True)]
+    return f"{random.choice(drinks)} - مظبوط"
+
+
+# --- (1) عدد الطلبات في الثانية ---
+# buffer: OrderBuffer => add_ticket_ms زمن الرد على الموظف، وorders_per_sec لحد ما آخر طلب يتكتب فعلاً
+def bench_orders(db, users, threads, orders, buffer=None):
+    per_thread = orders // threads
+    latencies = []
+    lock = threading.Lock()
+
+    def work():
+        mine = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            data.add_ticket(db, random.choice(users), "Office", random_order(db), "", buffer=buffer)
+            mine.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    if buffer is not None:
+        buffer.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        "orders": len(latencies),
+        "threads": threads,
+        "orders_per_sec": len(latencies) / elapsed,
+        "add_ticket_ms": percentiles(latencies),
+    }
+
+
+# --- (2) الوقت من الطلب لحد ما يظهر على شاشة مقدم الخدمة ---
+def bench_queue_latency(db, users, providers, orders, rate, poll_interval, use_feed):
+    db.tickets.update_many({"status": {"$in": list(OPEN_STATUSES)}}, {"$set": {"status": "Done"}})
+    feed = None
+    if use_feed:
+        feed = TicketFeed(db.tickets)
+        if not feed.start():
+            feed = None
+    sent = {}
+    seen = {}
+    lock = threading.Lock()
+    producing = threading.Event()
+    producing.set()
+
+    def provider():
+        version = feed.version(SITE, "Office") if feed else None
+        while producing.is_set() or len(seen) < len(sent):
+            if feed:
+                feed.wait_for_change(SITE, "Office", version, timeout=poll_interval)
+                version = feed.version(SITE, "Office")
+                tickets = feed.snapshot(SITE, "Office")
+            else:
+                # نفس الـ query بتاع الـ polling في app.py
+                tickets = list(db.tickets.find({"site_id": SITE, "type": "Office", "status": {"$in": list(OPEN_STATUSES)}}).sort("created_at"))
+            now = time.perf_counter()
+            for t in tickets:
+                with lock:
+                    if t['_id'] in sent and t['_id'] not in seen:
+                        seen[t['_id']] = now
+            for t in tickets:
+                if t['status'] == "New":
+                    data.update_ticket_status(db, t['_id'], "Done")
+            if not feed:
+                time.sleep(poll_interval)
+
+    workers = [threading.Thread(target=provider, daemon=True) for _ in range(providers)]
+    for w in workers:
+        w.start()
+    for _ in range(orders):
+        started = time.perf_counter()
+        ticket_id = data.add_ticket(db, random.choice(users), "Office", random_order(db), "")
+        with lock:
+            sent[ticket_id] = started
+        time.sleep(max(0, 1 / rate - (time.perf_counter() - started)))
+    producing.clear()
+    for w in workers:
+        w.join(timeout=30)
+    if feed:
+        feed.stop()
+    latencies = [(seen[k] - sent[k]) * 1000 for k in seen]
+    return {
+        "providers": providers,
+        "mode": "change_stream" if feed else "polling",
+        "poll_interval_s": poll_interval,
+        "delivered": len(latencies),
+        "sent": len(sent),
+        "ticket_to_screen_ms": percentiles(latencies),
+    }
+
+
+# --- (3) عدد أوامر الـ Mongo في كل rerun لكل نوع سيشن ---
+def bench_ops_per_rerun(db, counter):
+    month = analytics.list_months(db, SITE)[0]
+
+    def employee():
+        data.get_menu(db, available_only=True)
+
+    def provider():
+        list(db.tickets.find({"site_id": SITE, "type": "Office", "status": {"$in": list(OPEN_STATUSES)}}).sort("created_at"))
+
+    def admin_analytics():
+        analytics.list_days(db, month, SITE)
+        analytics.list_months(db, SITE)
+        analytics.type_report(db, analytics.period_match(month, site_id=SITE), "Office")
+
+    def admin_employees():
+        data.get_rooms(db)
+        data.get_users(db)
+
+    results = {}
+    for name, rerun in [("employee", employee), ("provider_polling", provider), ("admin_analytics", admin_analytics), ("admin_employees", admin_employees)]:
+        rerun()  # تسخين الكاش
+        with counter.measure() as counts:
+            rerun()
+        results[name] = {"commands": sum(counts.values()), "by_command": dict(counts)}
+    return results
+
+
+# --- (4) زمن التحليلات مقابل حجم الكوليكشن ---
+def bench_analytics(db, users, sizes, months, repeats):
+    results = []
+    inserted = db.tickets.count_documents({})
+    end = datetime.now()
+    for size in sizes:
+        batch = []
+        for _ in range(max(0, size - inserted)):
+            when = end - timedelta(seconds=random.randint(0, months * 30 * 86400))
+            kind = random.random() < 0.8
+            batch.append(data.make_ticket(
+                random.choice(users),
+                "Office" if kind else "IT",
+                random_order(db) if kind else random.choice(["نت", "PC", "برامج", "أخرى"]),
+                "", now=when,
+            ))
+            if len(batch) == 5000:
+                db.tickets.insert_many(batch)
+                batch = []
+        if batch:
+            db.tickets.insert_many(batch)
+        inserted = max(inserted, size)
+
+        started = time.perf_counter()
+        rollups.rebuild(db)
+        rebuild_s = time.perf_counter() - started
+
+        month = analytics.list_months(db, SITE)[0]
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            analytics.list_months(db, SITE)
+            analytics.list_days(db, month, SITE)
+            analytics.type_report(db, analytics.period_match(month, site_id=SITE), "Office")
+            analytics.type_report(db, analytics.period_match(month, site_id=SITE), "IT")
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append({
+            "tickets": db.tickets.estimated_document_count(),
+            "rollup_rows": db.ticket_rollups.estimated_document_count(),
+            "rollup_rebuild_s": rebuild_s,
+            "analytics_render_ms": percentiles(timings),
+        })
+    return results
+
+
+# --- (5) الطلبات من الـ API بدل سيشن Streamlit ---
+def bench_api(db, users, threads, orders):
+    secret = "bench"
+    server = api.serve(db, secret, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    per_thread = orders // threads
+    latencies = []
+    lock = threading.Lock()
+
+    def call(path, body, token=None):
+        request = urllib.request.Request(base + path, json.dumps(body).encode(), {"Content-Type": "application/json"})
+        if token:
+            request.add_header("Authorization", f"Bearer {token}")
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def work():
+        user = random.choice(users)
+        token = call("/api/login", {"username": user['username'], "password": user['password']})["token"]
+        mine = []
+        for _ in range(per_thread):
+            drink, sugar = random_order(db).split(" - ")
+            started = time.perf_counter()
+            call("/api/orders", {"type": "Office", "drink": drink, "sugar": sugar}, token)
+            mine.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return {
+        "orders": len(latencies),
+        "threads": threads,
+        "orders_per_sec": len(latencies) / elapsed,
+        "http_order_ms": percentiles(latencies),
+    }
+
+
+def run(args):
+    data.check_scratch_db(args.db, args.force)
+    counter = CommandCounter()
+    client = pymongo.MongoClient(args.uri or data.get_connection_string(), event_listeners=[counter])
+    db = client[args.db]
+    random.seed(args.seed)
+    try:
+        users = seed(db, args.employees, args.rooms, args.force)
+        report = {
+            "meta": {
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "server_version": client.server_info()["version"],
+                "args": vars(args),
+            },
+            "orders": bench_orders(db, users, args.threads, args.orders),
+            "orders_buffered": bench_orders(db, users, args.threads, args.orders, OrderBuffer(db).start()),
+            "api_orders": bench_api(db, users, args.threads, args.orders),
+            "queue_latency": bench_queue_latency(db, users, args.providers, args.latency_orders, args.rate, args.poll_interval, not args.no_feed),
+            "ops_per_rerun": bench_ops_per_rerun(db, counter),
+            "analytics": bench_analytics(db, users, args.sizes, args.months, args.repeats),
+        }
+    finally:
+        if not args.keep:
+            client.drop_database(args.db)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark لمسار الطلبات والتوزيع والتحليلات على mongod محلي")
+    parser.add_argument("--uri", help="من غيره: MONGO_CONNECTION_STRING أو .streamlit/secrets.toml")
+    parser.add_argument("--db", default="itqan_bench", help="داتا بيز مؤقتة بتتمسح في الآخر")
+    parser.add_argument("--keep", action="store_true", help="ماتمسحش الداتا بيز المؤقتة")
+    parser.add_argument("--force", action="store_true", help="يشتغل حتى لو --db هي داتا بيز التطبيق (هتتمسح)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--rooms", type=int, default=30)
+    parser.add_argument("--threads", type=int, default=50, help="موظفين بيطلبوا في نفس الوقت")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--providers", type=int, default=20)
+    parser.add_argument("--latency-orders", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50, help="طلبات في الثانية أثناء قياس التأخير")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--no-feed", action="store_true", help="قياس الـ polling حتى لو الـ Change Streams متاحة")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("-o", "--output", help="ملف JSON (من غيره: stdout)")
+    args = parser.parse_args()
+    try:
+        data.check_scratch_db(args.db, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = json.dumps(run(args), ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
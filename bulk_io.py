@@ -0,0 +1,194 @@
+import argparse
+import codecs
+import io
+import os
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from data import DEFAULT_SITE
+from refcache import cache
+
+# --- استيراد / تصدير الموظفين والغرف والمنيو (CSV / XLSX) ---
+# الملف كله بيتراجع مرة واحدة (اليوزرات والغرف الموجودة في query واحدة) وبعدين bulk_write واحد unordered بـ upserts
+# وكل صف فيه مشكلة بيرجع برقمه في الملف بدل ما يوقف الباقي
+# الاستيراد والتصدير لفرع واحد (site_id)، واليوزر unique على كل الفروع
+
+COLUMNS = {
+    "users": ["name", "username", "password", "room", "role", "routes", "floors"],
+    "rooms": ["name", "floor"],
+    "menu": ["name", "available"],
+}
+KEYS = {"users": "username", "rooms": "name", "menu": "name"}
+ROLES = {"موظف": "Employee", "بوفيه": "Office Boy", "IT": "IT Support", "مدير": "Admin"}
+LIST_SEPARATOR = "|"
+FORMATS = ("csv", "xlsx")
+MIME_TYPES = {"csv": "text/csv", "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+
+# --- القراية ---
+def read_rows(file, filename):
+    # كل القيم نصوص، والخانات الفاضية "" مش NaN
+    if filename.lower().endswith(".xlsx"):
+        frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+    else:
+        frame = pd.read_csv(file, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    frame.columns = [str(c).strip() for c in frame.columns]
+    return frame.to_dict("records")
+
+
+def _number(value):
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def _list(value):
+    return [v.strip() for v in value.split(LIST_SEPARATOR) if v.strip()]
+
+
+def _flag(value):
+    return value.strip().lower() not in ("0", "false", "no", "لا", "x")
+
+
+# --- المراجعة ---
+def _user(row, existing, rooms):
+    doc = {f: row[f] for f in ("name", "username", "password", "room", "role")}
+    if not doc["name"] or not doc["username"]:
+        return None, "الاسم واليوزر مطلوبين"
+    doc["role"] = ROLES.get(doc["role"], doc["role"])
+    if doc["role"] not in ROLES.values():
+        return None, f"وظيفة غير معروفة: {row['role']}"
+    if doc["room"] not in rooms:
+        return None, f"غرفة مش موجودة: {doc['room']}"
+    if not doc["password"]:
+        if doc["username"] not in existing:
+            return None, "الباسورد مطلوب لليوزر الجديد"
+        del doc["password"]  # اليوزر الموجود بيفضل بالباسورد بتاعه
+    # routes أسماء غرف (حتى لو شكلها أرقام زي "101") عشان تتقارن بـ user_room، والأدوار بس أرقام
+    if row.get("routes"):
+        doc["routes"] = _list(row["routes"])
+    if row.get("floors"):
+        doc["floors"] = [_number(v) for v in _list(row["floors"])]
+    return doc, None
+
+
+def _room(row, existing, rooms):
+    if not row["name"]:
+        return None, "اسم الغرفة مطلوب"
+    doc = {"name": row["name"]}
+    if row.get("floor"):
+        doc["floor"] = _number(row["floor"])
+    return doc, None
+
+
+def _menu(row, existing, rooms):
+    if not row["name"]:
+        return None, "اسم الصنف مطلوب"
+    return {"name": row["name"], "available": _flag(row.get("available") or "1")}, None
+
+
+VALIDATORS = {"users": _user, "rooms": _room, "menu": _menu}
+
+
+def validate(db, kind, rows, site_id=DEFAULT_SITE):
+    # => [(رقم الصف, doc)], [(رقم الصف, الغلط)], المفاتيح الموجودة قبل كده - رقم الصف زي ما هو في Excel (الهيدر صف 1)
+    key = KEYS[kind]
+    rows = [{k: str(v).strip() for k, v in row.items()} for row in rows]
+    missing = [c for c in dict.fromkeys(("name", key)) if rows and c not in rows[0]]
+    if missing:
+        return [], [(1, f"أعمدة ناقصة: {', '.join(missing)}")], set()
+    values = [row[key] for row in rows if row[key]]
+    scope = {} if kind == "users" else {"site_id": site_id}
+    found = list(db[kind].find({**scope, key: {"$in": values}}, {key: 1, "site_id": 1}))
+    existing = {d[key] for d in found if d.get("site_id") == site_id}
+    elsewhere = {d[key] for d in found if d.get("site_id") != site_id}
+    rooms = {r['name'] for r in db.rooms.find({"site_id": site_id}, {"name": 1})} if kind == "users" else set()
+    docs, errors, seen = [], [], set()
+    for number, row in enumerate(rows, start=2):
+        if row[key] in seen:
+            errors.append((number, f"مكرر في الملف: {row[key]}"))
+            continue
+        seen.add(row[key])
+        if row[key] in elsewhere:
+            errors.append((number, f"موجود في فرع تاني: {row[key]}"))
+            continue
+        doc, error = VALIDATORS[kind]({**dict.fromkeys(COLUMNS[kind], ""), **row}, existing, rooms)
+        if error:
+            errors.append((number, error))
+        else:
+            docs.append((number, doc))
+    return docs, errors, existing
+
+
+def import_rows(db, kind, rows, dry_run=False, site_id=DEFAULT_SITE):
+    docs, errors, existing = validate(db, kind, rows, site_id)
+    report = {
+        "inserted": sum(1 for _, d in docs if d[KEYS[kind]] not in existing),
+        "updated": sum(1 for _, d in docs if d[KEYS[kind]] in existing),
+        "errors": errors,
+    }
+    if dry_run or not docs:
+        return report
+    key = KEYS[kind]
+    ops = [UpdateOne({"site_id": site_id, key: d[key]}, {"$set": {**d, "site_id": site_id}}, upsert=True) for _, d in docs]
+    try:
+        db[kind].bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # unordered: الصفوف السليمة اتكتبت، والغلط بيرجع بالـ index بتاع العملية
+        for err in e.details.get("writeErrors", []):
+            number, doc = docs[err["index"]]
+            report["inserted" if doc[key] not in existing else "updated"] -= 1
+            report["errors"].append((number, err.get("errmsg", "write error")))
+        report["errors"].sort()
+    finally:
+        cache.invalidate(kind)
+    return report
+
+
+# --- التصدير ---
+def export_rows(db, kind, site_id=DEFAULT_SITE):
+    # الباسورد مابيطلعش في الملف (عمود فاضي)، والاستيراد بيسيب الباسورد الموجود لما الخانة فاضية
+    rows = []
+    for doc in db[kind].find({"site_id": site_id}, {"_id": 0, "password": 0}).sort(KEYS[kind]):
+        row = {}
+        for c in COLUMNS[kind]:
+            value = doc.get(c, "")
+            row[c] = LIST_SEPARATOR.join(str(v) for v in value) if isinstance(value, list) else value
+        rows.append(row)
+    return rows
+
+
+def to_bytes(rows, kind, fmt):
+    frame = pd.DataFrame(rows, columns=COLUMNS[kind])
+    out = io.BytesIO()
+    if fmt == "xlsx":
+        frame.to_excel(out, index=False)
+    else:
+        # utf-8-sig عشان Excel يقرا العربي صح
+        out.write(codecs.BOM_UTF8)
+        out.write(frame.to_csv(index=False).encode("utf-8"))
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    import data
+
+    parser = argparse.ArgumentParser(description="استيراد / تصدير الموظفين والغرف والمنيو")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("kind", choices=list(COLUMNS))
+    parser.add_argument("file", help=".csv أو .xlsx")
+    parser.add_argument("--dry-run", action="store_true", help="مراجعة الملف من غير كتابة")
+    parser.add_argument("--site", default=DEFAULT_SITE, help="site_id")
+    args = parser.parse_args()
+
+    db = data.get_db()
+    if args.action == "export":
+        fmt = "xlsx" if args.file.lower().endswith(".xlsx") else "csv"
+        rows = export_rows(db, args.kind, args.site)
+        with open(args.file, "wb") as f:
+            f.write(to_bytes(rows, args.kind, fmt))
+        print(f"{len(rows)} {args.kind} => {args.file}")
+    else:
+        with open(args.file, "rb") as f:
+            report = import_rows(db, args.kind, read_rows(f, os.path.basename(args.file)), args.dry_run, args.site)
+        for number, error in report["errors"]:
+            print(f"row {number}: {error}")
+        print(f"inserted {report['inserted']}, updated {report['updated']}, errors {len(report['errors'])}")
@@ -0,0 +1,233 @@
+import os
+import re
+import tomllib
+from datetime import datetime
+import pymongo
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson.objectid import ObjectId
+import rollups
+import service_stats
+from live_queue import OPEN_STATUSES
+from refcache import cache
+
+# --- دوال التعامل مع الداتا ---
+# مشتركة بين app.py وسكريبتات الصيانة، وكلها بتاخد الـ db كأول باراميتر
+
+
+def get_connection_string():
+    # للسكريبتات اللي بتشتغل برة Streamlit: MONGO_CONNECTION_STRING أو .streamlit/secrets.toml
+    connection_string = os.environ.get("MONGO_CONNECTION_STRING")
+    if connection_string is None:
+        with open(os.path.join(".streamlit", "secrets.toml"), "rb") as f:
+            connection_string = tomllib.load(f)["mongo"]["connection_string"]
+    return connection_string
+
+
+# داتا بيز التطبيق: سكريبتات الاختبار اللي بتمسح الداتا بترفض تشتغل عليها من غير --force
+APP_DB = "itqan_db"
+
+
+def get_db(connection_string=None):
+    return pymongo.MongoClient(connection_string or get_connection_string())[APP_DB]
+
+
+def check_scratch_db(name, force=False):
+    if name == APP_DB and not force:
+        raise ValueError(f"{name} هي داتا بيز التطبيق وهتتمسح => استخدم اسم تاني أو --force")
+
+
+# --- الفروع (Sites) ---
+# كل موظف وغرفة وصنف وتذكرة ليهم site_id، وكل الاستعلامات بتبدأ بيه (أول حقل في الـ indexes وفي الـ shard key)
+DEFAULT_SITE = "main"
+
+
+def site_of(user_data):
+    return user_data.get('site_id') or DEFAULT_SITE
+
+
+# --- (1) تهيئة المنيو (Upsert لمنع التكرار، في bulk_write واحد) ---
+DEFAULT_DRINKS = ["قهوة", "شاي", "نسكافيه", "مياه", "ينسون", "نعناع", "كركديه"]
+
+def seed_menu(db, site_id=DEFAULT_SITE):
+    db.menu.bulk_write([
+        UpdateOne({"site_id": site_id, "name": d}, {"$setOnInsert": {"site_id": site_id, "name": d, "available": True}}, upsert=True)
+        for d in DEFAULT_DRINKS
+    ], ordered=False)
+    cache.invalidate("menu")
+
+
+# --- (2) تهيئة الغرف (Teams/Rooms) ---
+# بس لو مفيش غرف خالص، عشان الغرف اللي الأدمن مسحها ماترجعش تاني
+DEFAULT_ROOMS = ["IT Office", "HR Room", "Accounts", "CEO Office", "Reception", "Sales Team"]
+
+def seed_rooms(db, site_id=DEFAULT_SITE):
+    if db.rooms.count_documents({"site_id": site_id}, limit=1) == 0:
+        db.rooms.insert_many([{"site_id": site_id, "name": r} for r in DEFAULT_ROOMS])
+        cache.invalidate("rooms")
+
+
+def get_user(db, username, password):
+    return db.users.find_one({"username": username, "password": password})
+
+
+def make_ticket(user_data, type, item, details, now=None, drink=None, sugar=None, issue=None):
+    now = now or datetime.now()
+    ticket = {
+        "site_id": site_of(user_data),
+        "user_name": user_data['name'],
+        "user_room": user_data['room'],
+        "type": type,
+        "item": item,
+        "details": details,
+        "status": "New",
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"), # التاريخ والوقت
+        "date_only": now.strftime("%Y-%m-%d"),          # التاريخ بس (للفلترة اليومية)
+        "month_year": now.strftime("%Y-%m"),            # الشهر والسنة (للفلترة الشهرية)
+        "created_at": now                               # datetime حقيقي (للـ index والترتيب)
+    }
+    # حقول منفصلة بدل ما التحليلات تفك "قهوة - مظبوط" كل مرة
+    if type == "Office":
+        parts = str(item).split('-', 1)
+        ticket["drink"] = drink or parts[0].strip()
+        ticket["sugar"] = sugar or (parts[1].strip() if len(parts) > 1 else None)
+    else:
+        ticket["issue"] = issue or item
+    return ticket
+
+
+def room_id(db, room_name, site_id=DEFAULT_SITE):
+    return next((r['_id'] for r in get_rooms(db, site_id) if r['name'] == room_name), None)
+
+
+def add_ticket(db, user_data, type, item, details, drink=None, sugar=None, issue=None, client_key=None, buffer=None):
+    # client_key: مفتاح من الفورم (idempotency) => نفس الطلب مايتسجلش مرتين لو الزرار اتداس مرتين أو الطلب اتعاد
+    # buffer: OrderBuffer => التذكرة بتتحط في الطابور وبترجع على طول، والكتابة بتتعمل مع غيرها في insert_many
+    ticket = make_ticket(user_data, type, item, details, drink=drink, sugar=sugar, issue=issue)
+    ticket["room_id"] = room_id(db, user_data['room'], ticket['site_id'])
+    if client_key:
+        ticket["client_key"] = client_key
+    if buffer is not None and buffer.alive:
+        return buffer.submit(ticket)
+    try:
+        db.tickets.insert_one(ticket)
+    except DuplicateKeyError:
+        if not client_key:
+            raise
+        # اتسجل قبل كده => نرجع نفس التذكرة من غير ما نزود الإحصائيات
+        return db.tickets.find_one({"site_id": ticket['site_id'], "client_key": client_key}, {"_id": 1})['_id']
+    rollups.record_ticket(db, ticket)
+    return ticket['_id']
+
+
+def update_ticket_status(db, ticket_id, status, ticket_type=None, provider=None, site_id=None):
+    # شرط الحالة بيخلي التذكرة تتقفل مرة واحدة بس لو اتنين داسوا "تم" في نفس الوقت
+    # ticket_type / site_id: مقدم الخدمة مايقفلش غير طلبات نوعه وفرعه (الـ API)
+    # وقت التغيير ومين عمله بيتكتبوا في نفس العملية مع الحالة
+    query = {"_id": ObjectId(ticket_id), "status": {"$ne": status}}
+    if ticket_type:
+        query["type"] = ticket_type
+    if site_id:
+        query["site_id"] = site_id
+    changes = {"status": status}
+    if status == "InProgress":
+        changes["claimed_at"] = datetime.now()
+    elif status == "Done":
+        changes["done_at"] = datetime.now()
+        if provider:
+            changes["done_by"] = provider
+    ticket = db.tickets.find_one_and_update(query, {"$set": changes}, projection=service_stats.FIELDS, return_document=ReturnDocument.AFTER)
+    if ticket is None:
+        return False
+    if status == "Done":
+        service_stats.record_done(db, ticket)
+    return True
+
+
+# --- البيانات المرجعية (من الكاش المشترك، وكل كتابة بتعمل invalidate) ---
+def get_menu(db, available_only=False, site_id=DEFAULT_SITE):
+    items = cache.get(db, "menu", site_id)
+    if available_only:
+        return [d for d in items if d.get('available')]
+    return items
+
+
+def get_rooms(db, site_id=DEFAULT_SITE):
+    return cache.get(db, "rooms", site_id)
+
+
+def get_users(db, site_id=DEFAULT_SITE):
+    return cache.get(db, "users", site_id)
+
+
+def toggle_stock(db, item_id, status):
+    db.menu.update_one({"_id": ObjectId(item_id)}, {"$set": {"available": status}})
+    cache.invalidate("menu")
+
+
+def add_menu_item(db, name, site_id=DEFAULT_SITE):
+    if name and not db.menu.find_one({"site_id": site_id, "name": name}):
+        db.menu.insert_one({"site_id": site_id, "name": name, "available": True})
+        cache.invalidate("menu")
+        return True
+    return False
+
+
+def reset_menu(db, site_id=DEFAULT_SITE):
+    db.menu.delete_many({"site_id": site_id})
+    cache.invalidate("menu")
+
+
+def add_room(db, name, site_id=DEFAULT_SITE):
+    if name and not db.rooms.find_one({"site_id": site_id, "name": name}):
+        db.rooms.insert_one({"site_id": site_id, "name": name})
+        cache.invalidate("rooms")
+        return True
+    return False
+
+
+def delete_room(db, room_id):
+    db.rooms.delete_one({"_id": ObjectId(room_id)})
+    cache.invalidate("rooms")
+
+
+def add_user(db, name, username, password, room, role, site_id=DEFAULT_SITE):
+    # اليوزر unique على مستوى كل الفروع (تسجيل الدخول من غير اختيار فرع)
+    if db.users.find_one({"username": username}):
+        return False
+    db.users.insert_one({"site_id": site_id, "name": name, "username": username, "password": password, "room": room, "role": role})
+    cache.invalidate("users")
+    return True
+
+
+def delete_user(db, user_id):
+    db.users.delete_one({"_id": ObjectId(user_id)})
+    cache.invalidate("users")
+
+
+# --- القوائم الطويلة (صفحات من السيرفر) ---
+PAGE_SIZE = 50
+
+
+def search_users(db, prefix="", after=None, limit=PAGE_SIZE, site_id=DEFAULT_SITE):
+    # صفحة موظفين مترتبة بالـ username، والصفحة اللي بعدها بتبدأ بعد آخر username (range cursor بدل skip)
+    # البحث بأول الكلمة (^prefix) على name / username / room بيستخدم الـ indexes
+    # => (الصفحة، فيه صفحة بعدها ولا لأ)
+    query = {"site_id": site_id}
+    if prefix:
+        pattern = {"$regex": "^" + re.escape(prefix)}
+        query["$or"] = [{"username": pattern}, {"name": pattern}, {"room": pattern}]
+    if after is not None:
+        query["username"] = {"$gt": after}
+    users = list(db.users.find(query, {"password": 0}).sort("username", 1).limit(limit + 1))
+    return users[:limit], len(users) > limit
+
+
+def count_open_tickets(db, site_id=DEFAULT_SITE):
+    return db.tickets.count_documents({"site_id": site_id, "status": {"$in": list(OPEN_STATUSES)}})
+
+
+def open_tickets(db, skip=0, limit=PAGE_SIZE, site_id=DEFAULT_SITE):
+    # المراقبة الحية من غير Change Streams: صفحة واحدة على index {site_id, status, created_at}
+    query = {"site_id": site_id, "status": {"$in": list(OPEN_STATUSES)}}
+    return list(db.tickets.find(query).sort("created_at", 1).skip(skip).limit(limit))
@@ -0,0 +1,119 @@
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+import data
+import service_stats
+
+# --- وضع التوزيع (Dispatch) لأكتر من مقدم خدمة ---
+# كل مقدم خدمة بيستلم التذكرة بـ find_one_and_update ذري (New => InProgress)
+# فمفيش اتنين يشتغلوا على نفس الطلب، وكل واحد ليه طابور خاص بيه (assigned_to)
+
+
+def provider_rooms(db, provider):
+    # التوزيع الاختياري: routes (أسماء غرف) أو floors (أدوار) على يوزر مقدم الخدمة
+    # None معناها كل الغرف
+    rooms = set(provider.get('routes') or [])
+    floors = provider.get('floors') or []
+    if floors:
+        rooms |= {r['name'] for r in data.get_rooms(db, data.site_of(provider)) if r.get('floor') in floors}
+    return sorted(rooms) or None
+
+
+def _routed(query, rooms):
+    if rooms:
+        query["user_room"] = {"$in": list(rooms)}
+    return query
+
+
+def claim_next(db, ticket_type, provider, rooms=None, site_id=data.DEFAULT_SITE):
+    # أقدم طلب جديد في الفرع (وفي الغرف بتاعته لو فيه توزيع)، أو None لو الطابور فاضي
+    return db.tickets.find_one_and_update(
+        _routed({"site_id": site_id, "type": ticket_type, "status": "New"}, rooms),
+        {"$set": {"status": "InProgress", "assigned_to": provider, "claimed_at": datetime.now()}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def complete_ticket(db, ticket_id, provider):
+    ticket = db.tickets.find_one_and_update(
+        {"_id": ObjectId(ticket_id), "status": "InProgress", "assigned_to": provider},
+        {"$set": {"status": "Done", "done_at": datetime.now(), "done_by": provider}},
+        projection=service_stats.FIELDS,
+        return_document=ReturnDocument.AFTER,
+    )
+    if ticket is None:
+        return False
+    service_stats.record_done(db, ticket)
+    return True
+
+
+def release_ticket(db, ticket_id, provider):
+    # رجوع الطلب للطابور العام
+    result = db.tickets.update_one(
+        {"_id": ObjectId(ticket_id), "status": "InProgress", "assigned_to": provider},
+        {"$set": {"status": "New"}, "$unset": {"assigned_to": "", "claimed_at": ""}},
+    )
+    return result.modified_count == 1
+
+
+# --- اختبار التزامن: مقدمين خدمة كتير على mongod محلي ---
+def concurrency_check(db, providers=20, tickets=500, ticket_type="Office", force=False):
+    data.check_scratch_db(db.name, force)
+    db.tickets.delete_many({})
+    now = datetime.now()
+    db.tickets.insert_many([
+        data.make_ticket({"name": "bench", "room": "bench"}, ticket_type, f"#{i}", "", now=now)
+        for i in range(tickets)
+    ])
+    completed = Counter()
+    errors = []
+    lock = threading.Lock()
+
+    def work(name):
+        try:
+            while True:
+                t = claim_next(db, ticket_type, name)
+                if t is None:
+                    return
+                if complete_ticket(db, t['_id'], name):
+                    with lock:
+                        completed[t['_id']] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(f"provider-{i}",)) for i in range(providers)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert not errors, f"provider errors: {errors[:3]}"
+    duplicates = [k for k, v in completed.items() if v != 1]
+    done = db.tickets.count_documents({"status": "Done"})
+    assert not duplicates, f"{len(duplicates)} tickets completed more than once"
+    assert len(completed) == tickets == done, f"completed {len(completed)} / done {done} / expected {tickets}"
+    return len(completed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="اختبار إن كل تذكرة بتتقفل مرة واحدة بس مع مقدمين خدمة كتير")
+    parser.add_argument("--providers", type=int, default=20)
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--db", default="itqan_dispatch_check", help="داتا بيز مؤقتة بتتمسح في الآخر")
+    parser.add_argument("--force", action="store_true", help="يشتغل حتى لو --db هي داتا بيز التطبيق (هتتمسح)")
+    args = parser.parse_args()
+    try:
+        data.check_scratch_db(args.db, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+
+    client = data.get_db().client
+    try:
+        n = concurrency_check(client[args.db], args.providers, args.tickets)
+        print(f"OK: {n} tickets completed exactly once by {args.providers} providers")
+    finally:
+        client.drop_database(args.db)
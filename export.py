@@ -0,0 +1,91 @@
+import argparse
+import codecs
+import csv
+import io
+from datetime import datetime
+import analytics
+import archive
+
+# --- تصدير التقارير (CSV / Parquet) بالـ Streaming ---
+# بنقرا من cursor عليه projection للأعمدة المطلوبة بس وعلى دفعات
+# وبنكتب كل دفعة في الملف على طول، فالذاكرة ثابتة مهما كان عدد التذاكر
+
+REPORT_FIELDS = ["timestamp", "type", "user_name", "user_room", "item", "details", "status", "claimed_at", "done_at", "done_by"]
+BATCH_SIZE = 5000
+
+
+def months_range(first_month, last_month, site_id=None):
+    # من أول شهر لآخر شهر (شامل) على created_at
+    match = analytics.period_range(first_month, site_id=site_id)
+    match["created_at"]["$lt"] = analytics.period_range(last_month)["created_at"]["$lt"]
+    return match
+
+
+def iter_batches(db, match, fields=REPORT_FIELDS, batch_size=BATCH_SIZE):
+    # الشهور المؤرشفة الأول وبعدها tickets
+    projection = {"_id": 0, **{f: 1 for f in fields}}
+    batch = []
+    for collection in archive.collections_for(db, match):
+        cursor = collection.find(match, projection).sort("created_at", 1).batch_size(batch_size)
+        for t in cursor:
+            batch.append(t)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def write_csv(db, match, out, fields=REPORT_FIELDS, batch_size=BATCH_SIZE):
+    # utf-8-sig عشان Excel يقرا العربي صح
+    out.write(codecs.BOM_UTF8)
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    rows = 0
+    for batch in iter_batches(db, match, fields, batch_size):
+        writer.writerows(batch)
+        out.write(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate()
+        rows += len(batch)
+    out.write(buf.getvalue().encode("utf-8"))
+    return rows
+
+
+def write_parquet(db, match, out, fields=REPORT_FIELDS, batch_size=BATCH_SIZE):
+    # pyarrow جاي مع Streamlit
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(f, pa.string()) for f in fields])
+    rows = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for batch in iter_batches(db, match, fields, batch_size):
+            columns = {f: [None if t.get(f) is None else str(t[f]) for t in batch] for f in fields}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+MIME_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+if __name__ == "__main__":
+    import data
+
+    parser = argparse.ArgumentParser(description="تصدير التذاكر لفترة من الشهور")
+    parser.add_argument("first_month", help="YYYY-MM")
+    parser.add_argument("last_month", nargs="?", help="YYYY-MM (من غيره: نفس الشهر)")
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument("--site", help="site_id (من غيره: كل الفروع)")
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    last_month = args.last_month or args.first_month
+    output = args.output or f"report_{args.first_month}_{last_month}.{args.format}"
+    started = datetime.now()
+    with open(output, "wb") as f:
+        rows = WRITERS[args.format](data.get_db(), months_range(args.first_month, last_month, args.site), f)
+    print(f"{rows} tickets => {output} ({(datetime.now() - started).total_seconds():.1f}s)")
@@ -0,0 +1,157 @@
+import threading
+import time
+from pymongo.errors import PyMongoError
+
+# --- طابور الطلبات المباشر (Change Streams) ---
+# مستمع واحد للبروسيس كله على db.tickets.watch()
+# بيحتفظ بالطلبات المفتوحة في الذاكرة ويبلغ كل شاشات مقدمي الخدمة لما الطابور يتغير
+# لو الـ Change Streams مش متاحة (mongod مش replica set) الشاشات بترجع للـ polling القديم
+
+# الطلبات المفتوحة: لسه جديدة أو مستلمة (وضع التوزيع)
+OPEN_STATUSES = ("New", "InProgress")
+
+
+class TicketFeed:
+    def __init__(self, collection, statuses=OPEN_STATUSES, retry_delay=2, max_failures=5):
+        self.collection = collection
+        self.statuses = tuple(statuses)
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.available = False
+        self._cond = threading.Condition()
+        self._tickets = {}   # _id => التذكرة (المفتوحة بس)
+        self._versions = {}  # (site_id, type) => رقم نسخة بيزيد مع كل تغيير في الطابور ده
+        self._thread = None
+        self._stream = None
+        self._stopped = False
+
+    # --- التشغيل ---
+    def start(self):
+        try:
+            stream = self._open()
+        except PyMongoError:
+            # standalone mongod: مفيش change streams
+            return False
+        self.available = True
+        self._thread = threading.Thread(target=self._run, args=(stream,), daemon=True, name="ticket-feed")
+        self._thread.start()
+        return True
+
+    def _open(self, resume_token=None):
+        # بنفتح الـ stream الأول وبعدين نحمل الموجود، عشان مايفوتناش أي تغيير في النص
+        stream = self.collection.watch(full_document="updateLookup", resume_after=resume_token)
+        self._stream = stream
+        if resume_token is None:
+            self._load()
+        return stream
+
+    def _load(self):
+        tickets = {t['_id']: t for t in self.collection.find({"status": {"$in": list(self.statuses)}})}
+        with self._cond:
+            queues = {_queue(t) for t in self._tickets.values()} | {_queue(t) for t in tickets.values()}
+            self._tickets = tickets
+            self._bump(queues)
+
+    def _run(self, stream):
+        failures = 0
+        while not self._stopped:
+            try:
+                with stream:
+                    for change in stream:
+                        self._apply(change)
+                        failures = 0
+                    # الـ stream اتقفل (invalidate بعد drop مثلاً) => نفتح واحد جديد ونحمل من الأول
+                    resume_token = None
+            except PyMongoError:
+                if self._stopped:
+                    return
+                failures += 1
+                resume_token = stream.resume_token
+                if failures >= self.max_failures:
+                    self._disable()
+                    return
+                time.sleep(self.retry_delay)
+            # stop() بيقفل الـ stream فاللوب بيخلص عادي => مانفتحش واحد جديد ونحمل الطابور تاني
+            if self._stopped:
+                return
+            try:
+                stream = self._open(resume_token)
+            except PyMongoError:
+                try:
+                    # التوكن ممكن يكون قديم ومش موجود في الـ oplog => نبدأ من جديد
+                    stream = self._open()
+                except PyMongoError:
+                    self._disable()
+                    return
+
+    def stop(self):
+        self._stopped = True
+        if self._stream is not None:
+            self._stream.close()
+        self._disable()
+
+    def _disable(self):
+        with self._cond:
+            self.available = False
+            self._cond.notify_all()
+
+    # --- تطبيق التغييرات ---
+    def _apply(self, change):
+        op = change['operationType']
+        if op in ("insert", "update", "replace", "delete"):
+            ticket_id = change['documentKey']['_id']
+            doc = change.get('fullDocument')
+            with self._cond:
+                old = self._tickets.pop(ticket_id, None)
+                queues = set()
+                if old is not None:
+                    queues.add(_queue(old))
+                if doc is not None and doc.get('status') in self.statuses:
+                    self._tickets[ticket_id] = doc
+                    queues.add(_queue(doc))
+                self._bump(queues)
+        elif op in ("drop", "rename", "dropDatabase"):
+            with self._cond:
+                self._bump({_queue(t) for t in self._tickets.values()})
+                self._tickets = {}
+
+    def _bump(self, queues):
+        queues = {q for q in queues if q[1] is not None}
+        if not queues:
+            return
+        for q in queues:
+            self._versions[q] = self._versions.get(q, 0) + 1
+        self._cond.notify_all()
+
+    # --- القراءة من الشاشات (كل فرع لوحده) ---
+    # ticket_type = None معناها كل الأنواع (شاشة المراقبة)
+    def _version(self, site_id, ticket_type):
+        if ticket_type is None:
+            return sum(v for (site, _), v in self._versions.items() if site == site_id)
+        return self._versions.get((site_id, ticket_type), 0)
+
+    def version(self, site_id, ticket_type):
+        with self._cond:
+            return self._version(site_id, ticket_type)
+
+    def snapshot(self, site_id, ticket_type):
+        with self._cond:
+            tickets = [
+                t for t in self._tickets.values()
+                if t.get('site_id') == site_id and (ticket_type is None or t.get('type') == ticket_type)
+            ]
+        return sorted(tickets, key=lambda t: t.get('timestamp', ""))
+
+    def wait_for_change(self, site_id, ticket_type, since, timeout=1):
+        # بترجع True لو الطابور اتغير (أو الـ feed وقع ولازم نرجع للـ polling)
+        # التغيير في فرع تاني بيصحي الـ thread بس مابيرجعش True
+        with self._cond:
+            self._cond.wait_for(
+                lambda: not self.available or self._version(site_id, ticket_type) != since,
+                timeout=timeout,
+            )
+            return not self.available or self._version(site_id, ticket_type) != since
+
+
+def _queue(ticket):
+    return ticket.get('site_id'), ticket.get('type')
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+import rollups
+from telemetry import telemetry
+
+# --- تجميع الطلبات قبل الكتابة (Group Commit) ---
+# زرار "اطلب" بيحط التذكرة في طابور في الذاكرة ويرجع على طول (الـ _id بيتعمل هنا)
+# وthread واحد بيكتب كل اللي اتجمع في insert_many واحد unordered، فزحمة الصبح مابتستناش round-trip لكل طلب
+# client_key (unique) بيخلي إعادة المحاولة آمنة: أي تكرار الداتا بيز بترفضه ومابيتحسبش في الإحصائيات
+# الطلبات اللي لسه في الطابور بتضيع لو البروسيس وقع فجأة (أقصى حاجة FLUSH_INTERVAL)
+# أي غلط في دفعة بيتسجل والـ thread بيكمل، ولو وقف لأي سبب add_ticket بيرجع يكتب على طول (alive)
+
+FLUSH_INTERVAL = 0.05  # ثانية
+MAX_BATCH = 500
+MAX_RETRIES = 3
+RETRY_DELAY = 0.5  # ثانية
+
+log = logging.getLogger(__name__)
+
+
+class OrderBuffer:
+    def __init__(self, db, write_concern=None, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH, max_retries=MAX_RETRIES):
+        self.db = db
+        self.collection = db.tickets if write_concern is None else db.tickets.with_options(write_concern=write_concern)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counts = {"submitted": 0, "inserted": 0, "duplicates": 0, "failed": 0, "batches": 0, "rollup_failed": 0, "errors": 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="order-buffer")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # بيكتب اللي فاضل في الطابور قبل ما يقف
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def submit(self, ticket):
+        ticket.setdefault("_id", ObjectId())
+        self._count("submitted", 1)
+        self._queue.put(ticket)
+        return ticket["_id"]
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "pending": self._queue.qsize(), "alive": self.alive}
+
+    def _count(self, name, n):
+        with self._lock:
+            self.counts[name] += n
+
+    # --- الـ thread ---
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._take()
+            if not batch:
+                continue
+            try:
+                with telemetry.section("order_flush", role="buffer"):
+                    self._flush(batch)
+            except Exception:
+                # مفيش غلط يوقف الـ thread: الطلبات اللي بعدها لازم تتكتب
+                log.exception("order flush crashed (%s orders)", len(batch))
+                self._count("errors", 1)
+
+    def _take(self):
+        # أول طلب بيفتح الدفعة، وبنستنى flush_interval نلم اللي وراه
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        inserted = self._insert(batch)
+        if inserted:
+            self._record(inserted)
+            self._count("inserted", len(inserted))
+
+    def _insert(self, batch):
+        # => التذاكر اللي اتكتبت فعلاً (من غير المكررة واللي فشلت)
+        inserted, pending = [], batch
+        for attempt in range(self.max_retries + 1):
+            self._count("batches", 1)
+            try:
+                self.collection.insert_many(pending, ordered=False)
+                return inserted + pending
+            except BulkWriteError as e:
+                codes = {err["index"]: err.get("code") for err in e.details.get("writeErrors", [])}
+                inserted += [t for i, t in enumerate(pending) if i not in codes]
+                self._count("duplicates", sum(1 for c in codes.values() if c == 11000))
+                pending = [pending[i] for i, c in sorted(codes.items()) if c != 11000]
+            except PyMongoError as e:
+                # مش عارفين إيه اللي اتكتب قبل الغلط => نسأل بالـ _id ونعيد الباقي بس
+                log.warning("order flush failed (attempt %s): %s", attempt + 1, e)
+                written = self._written(pending)
+                inserted += [t for t in pending if t["_id"] in written]
+                pending = [t for t in pending if t["_id"] not in written]
+            except Exception:
+                # تذكرة مش سليمة (InvalidDocument مثلاً) بتبوظ الدفعة كلها => كل تذكرة لوحدها عشان الباقي يتكتب
+                if len(pending) == 1:
+                    log.exception("dropped invalid order")
+                    self._count("failed", 1)
+                    return inserted
+                written = self._written(pending)
+                inserted += [t for t in pending if t["_id"] in written]
+                for t in pending:
+                    if t["_id"] not in written:
+                        inserted += self._insert([t])
+                return inserted
+            if not pending:
+                return inserted
+            time.sleep(RETRY_DELAY * (attempt + 1))
+        self._count("failed", len(pending))
+        log.error("dropped %s orders after %s attempts", len(pending), self.max_retries + 1)
+        return inserted
+
+    def _written(self, tickets):
+        try:
+            return {d["_id"] for d in self.db.tickets.find({"_id": {"$in": [t["_id"] for t in tickets]}}, {"_id": 1})}
+        except PyMongoError:
+            return set()
+
+    def _record(self, inserted):
+        # التذاكر اتكتبت خلاص => الإحصائيات بتتعاد لوحدها لو فشلت
+        # ولو فضلت فاشلة بتتسجل والحل: python rollups.py rebuild --month YYYY-MM
+        for attempt in range(self.max_retries + 1):
+            try:
+                rollups.record_tickets(self.db, inserted)
+                return
+            except PyMongoError as e:
+                log.warning("rollup write failed (attempt %s): %s", attempt + 1, e)
+                time.sleep(RETRY_DELAY * (attempt + 1))
+        self._count("rollup_failed", len(inserted))
+        months = sorted({t['month_year'] for t in inserted})
+        log.error("rollups missing %s orders, rebuild months: %s", len(inserted), ", ".join(months))
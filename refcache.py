@@ -0,0 +1,43 @@
+import threading
+import time
+
+# --- كاش البيانات المرجعية (المنيو، الغرف، الموظفين) ---
+# كاش واحد للبروسيس كله بيستخدمه كل السيشنز، وكل فرع (site_id) ليه نسخته
+# أي كتابة من التطبيق بتزود رقم النسخة (invalidate)، والـ TTL بيلحق التعديلات اللي حصلت برة التطبيق
+
+REFERENCE_TTL = 30  # ثانية
+
+# بيانات الدخول مش محتاجين نشيلها في الكاش
+PROJECTIONS = {"users": {"password": 0}}
+
+
+class ReferenceCache:
+    def __init__(self, ttl=REFERENCE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = {}  # collection => رقم النسخة
+        self._entries = {}   # (collection, site_id) => (version, loaded_at, docs)
+
+    def get(self, db, name, site_id=None):
+        now = time.monotonic()
+        key = (name, site_id)
+        with self._lock:
+            version = self._versions.get(name, 0)
+            entry = self._entries.get(key)
+        if entry and entry[0] == version and now - entry[1] < self.ttl:
+            return entry[2]
+        docs = list(db[name].find({} if site_id is None else {"site_id": site_id}, PROJECTIONS.get(name)))
+        with self._lock:
+            # لو حصلت كتابة أثناء القراية ماندخلش نسخة قديمة في الكاش
+            if self._versions.get(name, 0) == version:
+                self._entries[key] = (version, now, docs)
+        return docs
+
+    def invalidate(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            for key in [k for k in self._entries if k[0] == name]:
+                del self._entries[key]
+
+
+cache = ReferenceCache()
@@ -0,0 +1,66 @@
+import pickle
+import threading
+from collections import OrderedDict
+
+# --- كاش نتايج التحليلات (الأرقام + الرسومات) ---
+# المفتاح (شهر، يوم، عرض) ومعاه علامة آخر تعديل على ticket_rollups للفترة دي (watermark: الشهر أو اليوم)
+# الشهور والأيام المقفولة علامتها مابتتغيرش فبتتحسب مرة واحدة لكل الأدمنز، والنهارده (وشهره) بيتحسب تاني بس لما تيجي تذكرة جديدة
+
+RESULT_CACHE_MB = 64
+RESULT_CACHE_ENTRIES = 256
+
+
+def _size(value):
+    # تقدير تقريبي للحجم في الذاكرة (DataFrames + Plotly figures)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class ResultCache:
+    def __init__(self, max_mb=RESULT_CACHE_MB, max_entries=RESULT_CACHE_ENTRIES):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (month, day, view) => (watermark, value, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope, watermark, build):
+        # النتيجة المتخزنة لازم تتعامل read-only (بتتشارك بين كل السيشنز)
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry and entry[0] == watermark:
+                self._entries.move_to_end(scope)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = build()
+        size = _size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            old = self._entries.pop(scope, None)
+            if old:
+                self._bytes -= old[2]
+            self._entries[scope] = (watermark, value, size)
+            self._bytes += size
+            # LRU: الأقدم استخداماً يخرج الأول
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "mb": round(self._bytes / 1024 / 1024, 2), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+results = ResultCache()
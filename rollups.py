@@ -0,0 +1,162 @@
+import argparse
+import pymongo
+import analytics
+import archive
+
+# --- الإحصائيات المجمعة (ticket_rollups) ---
+# كل تذكرة بتزود عداد واحد بـ $inc (فرع × يوم × نوع × غرفة × موظف × صنف)
+# فالتقارير الشهرية واليومية بتقرا صفوف قليلة مهما كان عدد التذاكر
+
+KEY_FIELDS = ["site_id", "date_only", "type", "user_room", "user_name", "item_clean"]
+
+# تنظيف اسم المشروب (قهوة - سكر زيادة => قهوة) للتذاكر القديمة اللي مفيهاش drink / issue
+ITEM_CLEAN = {"$trim": {"input": {"$arrayElemAt": [{"$split": [{"$toString": "$item"}, "-"]}, 0]}}}
+ITEM_KEY = {"$ifNull": ["$drink", {"$ifNull": ["$issue", ITEM_CLEAN]}]}
+
+
+def clean_item(item):
+    return str(item).split('-')[0].strip()
+
+
+def item_key(ticket):
+    return ticket.get('drink') or ticket.get('issue') or clean_item(ticket['item'])
+
+
+def ensure_indexes(db):
+    # الـ unique index بيخلي الـ upsert آمن لو أكتر من طلب جه في نفس اللحظة (والـ $merge محتاجه)
+    db.ticket_rollups.create_index([(f, pymongo.ASCENDING) for f in KEY_FIELDS], unique=True)
+    db.ticket_rollups.create_index([("site_id", pymongo.ASCENDING), ("month_year", pymongo.ASCENDING), ("type", pymongo.ASCENDING)])
+    # علامة آخر تعديل لكل شهر ولكل يوم في كل فرع (كاش التحليلات)
+    db.ticket_rollups.create_index([("site_id", pymongo.ASCENDING), ("month_year", pymongo.ASCENDING), ("updated_at", pymongo.DESCENDING)])
+    db.ticket_rollups.create_index([("site_id", pymongo.ASCENDING), ("date_only", pymongo.ASCENDING), ("updated_at", pymongo.DESCENDING)])
+
+
+def _key(ticket):
+    return {
+        "site_id": ticket['site_id'],
+        "date_only": ticket['date_only'],
+        "type": ticket['type'],
+        "user_room": ticket['user_room'],
+        "user_name": ticket['user_name'],
+        "item_clean": item_key(ticket),
+    }
+
+
+def _increment(ticket, count):
+    # وقت السيرفر مش وقت البروسيس عشان الـ watermark مايتلخبطش لو الساعات مختلفة
+    return {"$inc": {"count": count}, "$setOnInsert": {"month_year": ticket['month_year']}, "$currentDate": {"updated_at": True}}
+
+
+def record_ticket(db, ticket):
+    db.ticket_rollups.update_one(_key(ticket), _increment(ticket, 1), upsert=True)
+
+
+def record_tickets(db, tickets):
+    # دفعة تذاكر (الـ OrderBuffer): التذاكر اللي ليها نفس المفتاح بتتجمع في $inc واحد، والكل في bulk_write واحد
+    groups = {}
+    for t in tickets:
+        key = _key(t)
+        frozen = tuple(key.values())
+        if frozen in groups:
+            groups[frozen][2] += 1
+        else:
+            groups[frozen] = [key, t, 1]
+    db.ticket_rollups.bulk_write(
+        [pymongo.UpdateOne(key, _increment(t, count), upsert=True) for key, t, count in groups.values()],
+        ordered=False,
+    )
+
+
+# --- إعادة البناء من التذاكر الأصلية ---
+def _raw_pipeline(match):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "site_id": "$site_id",
+                "date_only": "$date_only",
+                "type": "$type",
+                "user_room": "$user_room",
+                "user_name": "$user_name",
+                "item_clean": ITEM_KEY,
+            },
+            "month_year": {"$first": "$month_year"},
+            "count": {"$sum": 1},
+        }},
+        {"$replaceWith": {"$mergeObjects": ["$_id", {"month_year": "$month_year", "count": "$count", "updated_at": "$$NOW"}]}},
+    ]
+
+
+def _scope(month=None, site_id=None):
+    # => (فلتر ticket_rollups، فلتر التذاكر على created_at) لشهر و/أو فرع، و None يعني الكل
+    site = {} if site_id is None else {"site_id": site_id}
+    if month is None:
+        return site, site
+    return {**site, "month_year": month}, analytics.period_range(month, site_id=site_id)
+
+
+def rebuild(db, month=None, site_id=None):
+    match, period = _scope(month, site_id)
+    ensure_indexes(db)
+    db.ticket_rollups.delete_many(match)
+    pipeline = _raw_pipeline(period) + [
+        {"$merge": {
+            "into": "ticket_rollups",
+            "on": KEY_FIELDS,
+            "whenMatched": [{"$set": {"count": {"$add": ["$count", "$$new.count"]}, "updated_at": "$$new.updated_at"}}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+    # التذاكر الحالية + الأرشيف الشهري
+    for collection in archive.collections_for(db, period):
+        collection.aggregate(pipeline)
+    return db.ticket_rollups.count_documents(match)
+
+
+def reset(db, site_id=None):
+    db.ticket_rollups.delete_many({} if site_id is None else {"site_id": site_id})
+
+
+# --- مراجعة التطابق مع التذاكر الأصلية ---
+def check_month(db, month, site_id=None):
+    def as_counts(rows, counts=None):
+        counts = {} if counts is None else counts
+        for r in rows:
+            key = tuple(r.get(f) for f in KEY_FIELDS)
+            counts[key] = counts.get(key, 0) + r['count']
+        return counts
+
+    match, period = _scope(month, site_id)
+    raw = {}
+    for collection in archive.collections_for(db, period):
+        as_counts(collection.aggregate(_raw_pipeline(period)), raw)
+    rolled = as_counts(db.ticket_rollups.find(match))
+    mismatches = []
+    for key in sorted(set(raw) | set(rolled), key=str):
+        if raw.get(key, 0) != rolled.get(key, 0):
+            mismatches.append({**dict(zip(KEY_FIELDS, key)), "tickets": raw.get(key, 0), "rollups": rolled.get(key, 0)})
+    return mismatches
+
+
+if __name__ == "__main__":
+    import data
+
+    parser = argparse.ArgumentParser(description="ticket_rollups maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="إعادة بناء الإحصائيات من التذاكر")
+    p_rebuild.add_argument("--month", help="YYYY-MM (من غيره: كل الشهور)")
+    p_check = sub.add_parser("check", help="مقارنة الإحصائيات بالتذاكر لشهر معين")
+    p_check.add_argument("month", help="YYYY-MM")
+    for p in (p_rebuild, p_check):
+        p.add_argument("--site", help="site_id (من غيره: كل الفروع)")
+    args = parser.parse_args()
+
+    db = data.get_db()
+    if args.command == "rebuild":
+        print(f"rebuilt {rebuild(db, args.month, args.site)} rollup rows")
+    else:
+        mismatches = check_month(db, args.month, args.site)
+        for m in mismatches:
+            print(m)
+        print("OK" if not mismatches else f"{len(mismatches)} mismatches")
+        raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,145 @@
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+import archive
+import rollups
+import service_stats
+from data import DEFAULT_SITE
+
+# --- تجهيز الداتا بيز عند البدء (Indexes + Migrations) ---
+# كل الخطوات هنا idempotent: تتنفذ أكتر من مرة من غير ما تبوظ حاجة
+
+
+def _create_unique(collection, *fields):
+    # لو فيه تكرار قديم الـ unique هيفشل => نكتفي بـ index عادي لحد ما التكرار يتنضف
+    keys = [(field, ASCENDING) for field in fields]
+    try:
+        collection.create_index(keys, unique=True)
+        return None
+    except OperationFailure as e:
+        try:
+            collection.create_index(keys)
+        except OperationFailure:
+            pass
+        return f"{collection.name}.{'+'.join(fields)}: {e}"
+
+
+# indexes قديمة: الـ unique منها بيمنع نفس الاسم في فرعين، والباقي اتغطى بـ indexes بتبدأ بـ site_id أو مابقاش فيه query بيستخدمه
+# (وكل index زيادة بيتدفع تمنه مع كل insert وتغيير حالة)
+OBSOLETE_INDEXES = {
+    "tickets": ["type_1_status_1_created_at_1", "client_key_1", "assigned_to_1_status_1_created_at_1"],
+    "users": ["name_1", "room_1"],
+    "menu": ["name_1"],
+    "rooms": ["name_1"],
+    "ticket_rollups": [
+        "date_only_1_type_1_user_room_1_user_name_1_item_clean_1",
+        "month_year_1_type_1",
+        "month_year_1_updated_at_-1",
+    ],
+    "service_stats": ["date_only_1_type_1_dimension_1_key_1", "month_year_1_type_1"],
+}
+
+
+def _drop_obsolete(db):
+    for name, indexes in OBSOLETE_INDEXES.items():
+        existing = db[name].index_information()
+        for index in indexes:
+            if index in existing:
+                db[name].drop_index(index)
+
+
+def ensure_indexes(db):
+    warnings = []
+    _drop_obsolete(db)
+    # طابور مقدمي الخدمة {site_id, type, status} + ترتيب بالوقت
+    db.tickets.create_index([("site_id", ASCENDING), ("type", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)])
+    # المراقبة الحية {site_id, status}
+    db.tickets.create_index([("site_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)])
+    # الأرشفة {status: "Done", created_at} لكل الفروع مرة واحدة
+    db.tickets.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    # مفتاح الطلب من الفورم (idempotency): الداتا بيز بترفض نفس الطلب مرتين في نفس الفرع، والتذاكر القديمة من غيره مش داخلة في الـ index
+    # الـ shard key لازم يبقى prefix لأي unique index => لو هنعمل sharding يبقى {site_id: 1, client_key: 1} مش {site_id, created_at}
+    db.tickets.create_index([("site_id", ASCENDING), ("client_key", ASCENDING)], unique=True, partialFilterExpression={"client_key": {"$exists": True}})
+    # التقارير والتصدير بالفترة لكل فرع
+    db.tickets.create_index([("site_id", ASCENDING), ("created_at", ASCENDING)])
+    # إعادة بناء الإحصائيات بالفترة لكل الفروع
+    db.tickets.create_index([("created_at", ASCENDING)])
+    # تسجيل الدخول {username, password}
+    warnings.append(_create_unique(db.users, "username"))
+    # صفحات قائمة الموظفين والبحث بأول الاسم أو الغرفة جوه الفرع
+    db.users.create_index([("site_id", ASCENDING), ("username", ASCENDING)])
+    db.users.create_index([("site_id", ASCENDING), ("name", ASCENDING)])
+    db.users.create_index([("site_id", ASCENDING), ("room", ASCENDING)])
+    # المنيو والغرف {site_id, name}
+    warnings.append(_create_unique(db.menu, "site_id", "name"))
+    warnings.append(_create_unique(db.rooms, "site_id", "name"))
+    rollups.ensure_indexes(db)
+    service_stats.ensure_indexes(db)
+    return [w for w in warnings if w]
+
+
+def migrate_created_at(db, batch_size=1000):
+    # التذاكر القديمة متخزن فيها timestamp كـ string بس => نضيف created_at كـ BSON datetime
+    migrated = 0
+    query = {"created_at": {"$exists": False}}
+    while True:
+        batch = list(db.tickets.find(query, {"timestamp": 1}).limit(batch_size))
+        if not batch:
+            return migrated
+        ops = []
+        for t in batch:
+            try:
+                created_at = datetime.strptime(str(t.get('timestamp')), "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                created_at = t['_id'].generation_time.astimezone().replace(tzinfo=None)
+            ops.append(UpdateOne({"_id": t['_id']}, {"$set": {"created_at": created_at}}))
+        db.tickets.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+
+
+# السكر من "قهوة - مظبوط"
+SUGAR = {"$trim": {"input": {"$arrayElemAt": [{"$split": [{"$toString": "$item"}, "-"]}, 1]}}}
+
+
+def migrate_structured_fields(db):
+    # drink / sugar / issue / room_id للتذاكر القديمة (بتتعمل على السيرفر من غير ما التذاكر تيجي للتطبيق)
+    db.tickets.update_many({"type": "Office", "drink": {"$exists": False}}, [{"$set": {"drink": rollups.ITEM_CLEAN, "sugar": SUGAR}}])
+    db.tickets.update_many({"type": "IT", "issue": {"$exists": False}}, [{"$set": {"issue": "$item"}}])
+    for r in db.rooms.find({}, {"name": 1}):
+        db.tickets.update_many({"user_room": r['name'], "room_id": {"$exists": False}}, {"$set": {"room_id": r['_id']}})
+
+
+def migrate_sites(db):
+    # كل الداتا اللي قبل الفروع بتبقى في الفرع الافتراضي
+    missing = {"site_id": {"$exists": False}}
+    collections = ["users", "rooms", "menu", "tickets", "ticket_rollups", "service_stats"]
+    collections += [archive.archive_name(month) for month in archive.archived_months(db)]
+    for name in collections:
+        db[name].update_many(missing, {"$set": {"site_id": DEFAULT_SITE}})
+
+
+def _run_once(db, name, migration):
+    # علامة في meta عشان الـ migration مايعملش scan للكوليكشن مع كل بداية بروسيس
+    if db.meta.find_one({"_id": "migrations", name: True}):
+        return
+    migration(db)
+    db.meta.update_one({"_id": "migrations"}, {"$set": {name: True}}, upsert=True)
+
+
+def bootstrap(db):
+    warnings = ensure_indexes(db)
+    _run_once(db, "created_at", migrate_created_at)
+    _run_once(db, "structured_fields", migrate_structured_fields)
+    _run_once(db, "sites", migrate_sites)
+    # الإحصائيات المجمعة لو لسه فاضية بنبنيها من التذاكر الموجودة
+    if db.ticket_rollups.estimated_document_count() == 0 and db.tickets.estimated_document_count() > 0:
+        rollups.rebuild(db)
+    return warnings
+
+
+if __name__ == "__main__":
+    import data
+
+    for w in bootstrap(data.get_db()):
+        print("WARNING:", w)
+    print("OK")
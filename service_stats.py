@@ -0,0 +1,94 @@
+import bisect
+import pymongo
+from pymongo import UpdateOne
+
+# --- زمن الخدمة (من الطلب لحد "تم") ---
+# كل تذكرة بتتقفل بتزود خانة واحدة في histogram لكل (فرع × يوم × نوع × بُعد × مفتاح) بـ $inc
+# فالـ p50 / p95 بيتحسبوا من صفوف قليلة من غير ما نلف على التذاكر نفسها
+
+# حدود الخانات بالثانية (الخانة الأخيرة لأي حاجة أكبر من يوم)
+BUCKETS = [30, 60, 120, 180, 300, 420, 600, 900, 1200, 1800, 2700, 3600, 7200, 14400, 28800, 86400]
+DIMENSIONS = ("all", "room", "provider", "hour")
+
+# الحقول اللي محتاجينها من التذكرة بعد ما تتقفل
+FIELDS = {"site_id": 1, "type": 1, "user_room": 1, "date_only": 1, "month_year": 1, "created_at": 1, "done_at": 1, "done_by": 1}
+
+
+def ensure_indexes(db):
+    db.service_stats.create_index(
+        [("site_id", pymongo.ASCENDING), ("date_only", pymongo.ASCENDING), ("type", pymongo.ASCENDING),
+         ("dimension", pymongo.ASCENDING), ("key", pymongo.ASCENDING)],
+        unique=True,
+    )
+    db.service_stats.create_index([("site_id", pymongo.ASCENDING), ("month_year", pymongo.ASCENDING), ("type", pymongo.ASCENDING)])
+
+
+def bucket(seconds):
+    return bisect.bisect_left(BUCKETS, seconds)
+
+
+def record_done(db, ticket):
+    created, done = ticket.get('created_at'), ticket.get('done_at')
+    if not created or not done:
+        return
+    seconds = max((done - created).total_seconds(), 0)
+    keys = {
+        "all": "all",
+        "room": ticket.get('user_room'),
+        "provider": ticket.get('done_by') or "-",
+        "hour": created.hour,  # ساعة الطلب (لحساب عدد مقدمي الخدمة المطلوب في كل ساعة)
+    }
+    db.service_stats.bulk_write([
+        UpdateOne(
+            {"site_id": ticket.get('site_id'), "date_only": ticket['date_only'], "type": ticket['type'], "dimension": dimension, "key": key},
+            {"$inc": {"count": 1, "seconds": seconds, f"buckets.{bucket(seconds)}": 1}, "$setOnInsert": {"month_year": ticket['month_year']}},
+            upsert=True,
+        )
+        for dimension, key in keys.items()
+    ], ordered=False)
+
+
+def percentile(buckets, q):
+    # تقريب خطي جوه الخانة اللي فيها الترتيب المطلوب
+    total = sum(buckets)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(buckets):
+        if n and seen + n >= target:
+            low = BUCKETS[i - 1] if i else 0
+            high = BUCKETS[i] if i < len(BUCKETS) else low
+            return low + (high - low) * (target - seen) / n
+        seen += n
+    return BUCKETS[-1]
+
+
+def report(db, match, ticket_type):
+    # => {dimension: [{key, count, avg_min, p50_min, p95_min}]}  (match زي analytics.period_match)
+    pipeline = [
+        {"$match": {**match, "type": ticket_type}},
+        {"$group": {
+            "_id": {"dimension": "$dimension", "key": "$key"},
+            "count": {"$sum": "$count"},
+            "seconds": {"$sum": "$seconds"},
+            **{f"b{i}": {"$sum": f"$buckets.{i}"} for i in range(len(BUCKETS) + 1)},
+        }},
+    ]
+    result = {}
+    for r in db.service_stats.aggregate(pipeline):
+        buckets = [r[f"b{i}"] for i in range(len(BUCKETS) + 1)]
+        result.setdefault(r["_id"]["dimension"], []).append({
+            "key": r["_id"]["key"],
+            "count": r["count"],
+            "avg_min": round(r["seconds"] / r["count"] / 60, 1),
+            "p50_min": round(percentile(buckets, 0.5) / 60, 1),
+            "p95_min": round(percentile(buckets, 0.95) / 60, 1),
+        })
+    for dimension, rows in result.items():
+        rows.sort(key=(lambda x: x["key"]) if dimension == "hour" else (lambda x: -x["count"]))
+    return result
+
+
+def reset(db, site_id=None):
+    db.service_stats.delete_many({} if site_id is None else {"site_id": site_id})
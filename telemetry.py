@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# --- قياس الأداء لكل rerun + أوامر الـ Mongo ---
+# CommandListener بيسجل كل أمر Mongo على الجزء (section) والدور (role) اللي شغالين دلوقتي في نفس الـ thread
+# والأرقام بتظهر في تبويب التشخيص عند الأدمن وبتتصدر بصيغة Prometheus
+
+RECENT_RERUNS = 200
+PROMETHEUS_WRITE_EVERY = 15  # ثانية
+
+
+def _documents(event):
+    # عدد الـ documents اللي رجعت (find/aggregate/getMore) أو اتأثرت (insert/update/delete)
+    reply = event.reply or {}
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if "values" in reply:
+        return len(reply["values"])
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class Telemetry(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.commands = {}   # (role, section, command) => [count, seconds, documents]
+        self.sections = {}   # (role, section) => [runs, seconds, max_seconds]
+        self.reruns = {}     # role => عدد الـ reruns
+        self.recent = deque(maxlen=RECENT_RERUNS)
+        self.prometheus_file = None
+        self._last_write = 0
+
+    # --- السياق الحالي (لكل thread) ---
+    def _context(self):
+        return getattr(self._local, "role", "anonymous"), getattr(self._local, "section", "other")
+
+    def set_role(self, role):
+        self._local.role = role or "anonymous"
+
+    def begin_rerun(self):
+        self._local.role = "anonymous"
+        self._local.rerun = {"started": time.time(), "sections": {}, "commands": 0, "documents": 0}
+        self._local.rerun_started = time.perf_counter()
+
+    def end_rerun(self):
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is None:
+            return
+        self._local.rerun = None
+        role = self._context()[0]
+        rerun["role"] = role
+        rerun["seconds"] = time.perf_counter() - self._local.rerun_started
+        with self._lock:
+            self.reruns[role] = self.reruns.get(role, 0) + 1
+            self.recent.append(rerun)
+        self._maybe_write_prometheus()
+
+    @contextmanager
+    def rerun(self):
+        # للـ fragments: الـ run لوحده بيتسجل كـ rerun، ولو جوه rerun كامل بيتحسب جواه
+        if getattr(self._local, "rerun", None) is not None:
+            yield
+            return
+        self.begin_rerun()
+        try:
+            yield
+        finally:
+            self.end_rerun()
+
+    @contextmanager
+    def section(self, name, role=None):
+        # الزمن المسجل للجزء من غير الأجزاء اللي جواه (لو فيه section جوه section)
+        if role is not None:
+            self.set_role(role)
+        previous = getattr(self._local, "section", "other")
+        previous_children = getattr(self._local, "children", 0.0)
+        self._local.section = name
+        self._local.children = 0.0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - started
+            elapsed = total - self._local.children
+            self._local.section = previous
+            self._local.children = previous_children + total
+            key = (self._context()[0], name)
+            with self._lock:
+                stats = self.sections.setdefault(key, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+            rerun = getattr(self._local, "rerun", None)
+            if rerun is not None:
+                rerun["sections"].setdefault(name, {"seconds": 0.0})["seconds"] += elapsed
+
+    # --- CommandListener ---
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, _documents(event))
+
+    def failed(self, event):
+        self._record(event, 0)
+
+    def _record(self, event, documents):
+        role, section = self._context()
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            stats = self.commands.setdefault((role, section, event.command_name), [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += documents
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is not None:
+            rerun["commands"] += 1
+            rerun["documents"] += documents
+            s = rerun["sections"].setdefault(section, {"seconds": 0.0})
+            s["commands"] = s.get("commands", 0) + 1
+            s["documents"] = s.get("documents", 0) + documents
+
+    # --- القراءة والتصدير ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "commands": [
+                    {"role": r, "section": s, "command": c, "count": v[0], "seconds": v[1], "documents": v[2]}
+                    for (r, s, c), v in sorted(self.commands.items())
+                ],
+                "sections": [
+                    {"role": r, "section": s, "runs": v[0], "seconds": v[1], "max_seconds": v[2]}
+                    for (r, s), v in sorted(self.sections.items())
+                ],
+                "reruns": dict(self.reruns),
+                "recent": list(self.recent),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.commands.clear()
+            self.sections.clear()
+            self.reruns.clear()
+            self.recent.clear()
+
+    def prometheus(self):
+        def labels(**kw):
+            return ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in kw.items())
+
+        snap = self.snapshot()
+        lines = []
+        metrics = [
+            ("itqan_mongo_commands_total", "Mongo commands by role/section/command", "commands", "count"),
+            ("itqan_mongo_command_seconds_total", "Mongo command time", "commands", "seconds"),
+            ("itqan_mongo_documents_total", "Documents returned or affected", "commands", "documents"),
+            ("itqan_section_runs_total", "Section executions", "sections", "runs"),
+            ("itqan_section_seconds_total", "Section wall time", "sections", "seconds"),
+        ]
+        for name, help_text, source, field in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for row in snap[source]:
+                keys = {k: row[k] for k in ("role", "section", "command") if k in row}
+                lines.append(f"{name}{{{labels(**keys)}}} {row[field]}")
+        lines.append("# HELP itqan_reruns_total Full script reruns by role")
+        lines.append("# TYPE itqan_reruns_total counter")
+        for role, n in sorted(snap["reruns"].items()):
+            lines.append(f"itqan_reruns_total{{{labels(role=role)}}} {n}")
+        return "\n".join(lines) + "\n"
+
+    def _maybe_write_prometheus(self):
+        if not self.prometheus_file or time.monotonic() - self._last_write < PROMETHEUS_WRITE_EVERY:
+            return
+        self._last_write = time.monotonic()
+        tmp = f"{self.prometheus_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, self.prometheus_file)
+
+
+telemetry = Telemetry()
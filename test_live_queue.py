@@ -0,0 +1,124 @@
+import threading
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+from live_queue import TicketFeed
+
+# --- TicketFeed: فتح / قفل الـ stream، الـ invalidate، والتوقف بعد max_failures ---
+# change stream وهمي: كل stream بيرجع التغييرات اللي اتحددت له وبعدين يخلص أو يرمي غلط أو يستنى لحد ما يتقفل
+
+
+class FakeStream:
+    def __init__(self, changes=(), end="block"):
+        self.changes = list(changes)
+        self.end = end  # "block" / "close" / PyMongoError
+        self.closed = threading.Event()
+        self.resume_token = {"_data": "token"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield from self.changes
+        if isinstance(self.end, Exception):
+            raise self.end
+        if self.end == "block":
+            self.closed.wait()
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeCollection:
+    def __init__(self, streams=(), docs=(), fail_watch=False):
+        self.streams = list(streams)
+        self.docs = list(docs)
+        self.fail_watch = fail_watch
+        self.opens = []  # resume_after لكل watch
+        self.loads = 0
+
+    def watch(self, full_document=None, resume_after=None):
+        if self.fail_watch:
+            raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+        self.opens.append(resume_after)
+        return self.streams.pop(0) if self.streams else FakeStream()
+
+    def find(self, query):
+        self.loads += 1
+        return [dict(d) for d in self.docs]
+
+
+def ticket(i, status="New"):
+    return {"_id": i, "site_id": "main", "type": "Office", "status": status, "timestamp": f"2024-05-01 10:00:{i:02d}"}
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_start_stop_opens_and_loads_once():
+    collection = FakeCollection(docs=[ticket(1)])
+    feed = TicketFeed(collection)
+    assert feed.start()
+    feed.stop()
+    feed._thread.join(2)
+    assert not feed._thread.is_alive()
+    assert collection.opens == [None] and collection.loads == 1
+    assert not feed.available
+
+
+def test_changes_update_snapshot_and_version():
+    stream = FakeStream([
+        {"operationType": "insert", "documentKey": {"_id": 2}, "fullDocument": ticket(2)},
+        {"operationType": "update", "documentKey": {"_id": 1}, "fullDocument": ticket(1, "Done")},
+    ])
+    feed = TicketFeed(FakeCollection([stream], docs=[ticket(1)]))
+    feed.start()
+    try:
+        wait_until(lambda: [t['_id'] for t in feed.snapshot("main", "Office")] == [2])
+        assert feed.version("main", "Office") >= 2
+        assert feed.snapshot("other", "Office") == []
+    finally:
+        feed.stop()
+
+
+def test_invalidate_reopens_and_reloads():
+    invalidated = FakeStream([{"operationType": "invalidate"}], end="close")
+    collection = FakeCollection([invalidated], docs=[ticket(1)])
+    feed = TicketFeed(collection)
+    feed.start()
+    try:
+        wait_until(lambda: len(collection.opens) == 2)
+        # stream جديد من الأول (من غير resume token) وتحميل الطابور تاني
+        assert collection.opens == [None, None]
+        wait_until(lambda: collection.loads == 2)
+        assert feed.available
+    finally:
+        feed.stop()
+    feed._thread.join(2)
+    assert len(collection.opens) == 2 and collection.loads == 2
+
+
+def test_gives_up_after_max_failures():
+    error = PyMongoError("connection lost")
+    collection = FakeCollection([FakeStream(end=error) for _ in range(3)])
+    feed = TicketFeed(collection, retry_delay=0, max_failures=3)
+    feed.start()
+    feed._thread.join(2)
+    assert not feed._thread.is_alive() and not feed.available
+    # أول stream من غير توكن، وبعد كل غلط بنكمل من الـ resume token من غير تحميل تاني
+    assert collection.opens == [None, {"_data": "token"}, {"_data": "token"}]
+    assert collection.loads == 1
+    # الشاشات اللي مستنية بتصحى وترجع للـ polling
+    assert feed.wait_for_change("main", "Office", 0, timeout=0)
+
+
+def test_start_without_change_streams():
+    feed = TicketFeed(FakeCollection(fail_watch=True))
+    assert not feed.start()
+    assert not feed.available and feed._thread is None
@@ -0,0 +1,151 @@
+import time
+from collections import namedtuple
+import bson
+import pytest
+import pymongo
+from pymongo.errors import AutoReconnect, BulkWriteError
+import order_buffer
+from order_buffer import OrderBuffer
+
+# --- OrderBuffer: أي غلط في دفعة مايوقفش الـ thread ومايضيعش الطلبات اللي بعدها ---
+# داتا بيز وهمية في الذاكرة (insert_many / find / bulk_write بس)
+# الـ UpdateOne بتاع pymongo مالوش attributes عامة => بنبدله بـ namedtuple ونسجل (filter, update)
+Update = namedtuple("Update", ["filter", "update", "upsert"])
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.updates = []  # (filter, update) من bulk_write
+        self.fail = []  # exceptions للمحاولات الجاية بالترتيب
+
+    def insert_many(self, docs, ordered=True):
+        if self.fail:
+            raise self.fail.pop(0)
+        for d in docs:
+            bson.encode(d)  # InvalidDocument زي الدرايفر
+        errors = []
+        for i, d in enumerate(docs):
+            if d["_id"] in self.docs:
+                errors.append({"index": i, "code": 11000})
+            else:
+                self.docs[d["_id"]] = d
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def find(self, query, projection=None):
+        return [{"_id": i} for i in query["_id"]["$in"] if i in self.docs]
+
+    def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise self.fail.pop(0)
+        self.updates.extend((op.filter, op.update) for op in ops)
+
+
+class FakeDb:
+    def __init__(self):
+        self.tickets = FakeCollection()
+        self.ticket_rollups = FakeCollection()
+
+
+def ticket(**extra):
+    return {"site_id": "main", "date_only": "2024-05-01", "month_year": "2024-05", "type": "IT",
+            "user_room": "R", "user_name": "A", "item": "نت", "issue": "نت", **extra}
+
+
+def rollup_count(db):
+    return sum(update["$inc"]["count"] for _, update in db.ticket_rollups.updates)
+
+
+def wait_idle(buffer, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = buffer.stats()
+        if stats["pending"] == 0 and stats["submitted"] == stats["inserted"] + stats["duplicates"] + stats["failed"]:
+            return stats
+        time.sleep(0.01)
+    raise AssertionError(f"buffer not idle: {buffer.stats()}")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(order_buffer, "RETRY_DELAY", 0)
+    monkeypatch.setattr(pymongo, "UpdateOne", lambda filter, update, upsert=False: Update(filter, update, upsert))
+    return FakeDb()
+
+
+@pytest.fixture
+def buffer(db):
+    buffer = OrderBuffer(db, flush_interval=0.01).start()
+    yield buffer
+    buffer.stop()
+
+
+def test_rollup_error_is_retried(db, buffer):
+    db.ticket_rollups.fail = [AutoReconnect("rollups down")]
+    for _ in range(3):
+        buffer.submit(ticket())
+    wait_idle(buffer)
+    assert len(db.tickets.docs) == 3
+    assert rollup_count(db) == 3
+    assert {(f["site_id"], f["item_clean"]) for f, _ in db.ticket_rollups.updates} == {("main", "نت")}
+    assert buffer.alive
+
+
+def test_rollup_failure_keeps_thread_alive(db, buffer):
+    db.ticket_rollups.fail = [AutoReconnect("rollups down")] * (buffer.max_retries + 1)
+    buffer.submit(ticket())
+    wait_idle(buffer)
+    for _ in range(3):
+        buffer.submit(ticket())
+    stats = wait_idle(buffer)
+    assert stats["rollup_failed"] == 1 and stats["inserted"] == 4 and stats["alive"]
+    assert rollup_count(db) == 3
+
+
+def test_invalid_order_does_not_drop_batch(db):
+    buffer = OrderBuffer(db, flush_interval=0.2).start()
+    good = [buffer.submit(ticket()) for _ in range(2)]
+    buffer.submit(ticket(details=object()))
+    buffer.stop()
+    assert set(db.tickets.docs) == set(good)
+    assert buffer.stats()["failed"] == 1
+
+
+def test_unexpected_error_keeps_thread_alive(db, buffer, monkeypatch):
+    flush = buffer._flush
+    calls = []
+
+    def crash_once(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        flush(batch)
+
+    monkeypatch.setattr(buffer, "_flush", crash_once)
+    buffer.submit(ticket())
+    deadline = time.monotonic() + 5
+    while buffer.stats()["errors"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    buffer.submit(ticket())
+    deadline = time.monotonic() + 5
+    while not db.tickets.docs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert buffer.alive and buffer.stats()["errors"] == 1 and len(db.tickets.docs) == 1
+
+
+def test_duplicates_are_not_counted(db, buffer):
+    first = ticket()
+    buffer.submit(first)
+    wait_idle(buffer)
+    buffer.submit(dict(first))
+    stats = wait_idle(buffer)
+    assert stats["duplicates"] == 1 and len(db.tickets.docs) == 1
+    assert rollup_count(db) == 1
+
+
+def test_stopped_buffer_is_not_alive(db):
+    buffer = OrderBuffer(db).start()
+    assert buffer.alive
+    buffer.stop()
+    assert not buffer.alive and buffer.stats()["alive"] is False